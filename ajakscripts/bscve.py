@@ -1,39 +1,84 @@
 #!/usr/bin/env python3
 
+import argparse
+import json
 import sys
 
-from gbugs import bgo
+from ajakscripts import gbugs, profiling
+from ajakscripts.bugcache import DEFAULT_CHUNK_SIZE
 
 
-def main():
+def read_aliases(args):
+    """Yield aliases from the arguments, or from stdin as it comes in"""
     if sys.stdin.isatty():
-        aliases = sys.argv[1:]
+        yield from args.aliases
     else:
-        lines = sys.stdin.read()
-        aliases = [line.strip() for line in lines.split()]
+        for line in sys.stdin:
+            yield from line.split()
 
-    if len(list(filter(None, aliases))) == 0:
-        print("No input! Exiting")
-        sys.exit(1)
 
-    # deduplicate, sort
-    aliases = sorted(list(set(aliases)))
+def print_chunk(chunk, bugs, fmt, printed):
+    if fmt == "text":
+        for bug in bugs:
+            # A bug carrying several of our aliases is only listed once
+            if bug.id not in printed:
+                printed.add(bug.id)
+                print(f"{bug.weburl} {bug.summary}", flush=True)
+        return
+
+    # One record per alias that was asked for
+    by_alias = {alias: bug for bug in bugs
+                for alias in getattr(bug, "alias", None) or []}
+    for alias in chunk:
+        bug = by_alias.get(alias)
+        if fmt == "tsv":
+            print("\t".join([alias, str(bug.id) if bug else "",
+                             bug.summary if bug else ""]), flush=True)
+        else:
+            print(json.dumps({
+                "alias": alias,
+                "id": bug.id if bug else None,
+                "url": bug.weburl if bug else None,
+                "summary": bug.summary if bug else None,
+            }), flush=True)
+
 
-    query = bgo.build_query(
-        alias=aliases,
-        include_fields=["id", "summary", "alias"],
-    )
+def main():
+    parser = argparse.ArgumentParser(
+        description="Find the bugs for CVEs, read from stdin if it's a pipe")
+    parser.add_argument('-f', '--format', choices=["text", "tsv", "json"],
+                        default="text",
+                        help="tsv and json (one object per line) give a "
+                             "record for every alias, empty if it has no bug")
+    parser.add_argument('-c', '--chunk-size', type=int,
+                        default=DEFAULT_CHUNK_SIZE,
+                        help="aliases per Bugzilla query")
+    parser.add_argument('-j', '--jobs', type=int, default=4,
+                        help="queries to run at once")
+    parser.add_argument('aliases', nargs='*')
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    profiling.setup(args)
 
-    bugs = bgo.query(query)
+    # Results are printed as every chunk comes back instead of after reading
+    # all the input, so the order is no longer sorted
+    printed = set()
+    missing = []
+    seen_any = False
+    for chunk, bugs, chunk_missing in gbugs.iter_aliases(
+            read_aliases(args), args.chunk_size, args.jobs):
+        seen_any = True
+        print_chunk(chunk, bugs, args.format, printed)
+        missing += chunk_missing
 
-    for bug in bugs:
-        for bug_alias in bug.alias:
-            # keep track of the aliases we've seen so we can say which we
-            # haven't seen at the end
-            if bug_alias in aliases:
-                aliases.remove(bug_alias)
-        print(f"{bug.weburl} {bug.summary}")
+    if not seen_any:
+        print("No input! Exiting")
+        sys.exit(1)
 
     # if there are aliases we haven't seen, output them here
-    if aliases:
-        print(f"no bug: {' '.join(aliases)}")
+    if missing and args.format == "text":
+        print(f"no bug: {' '.join(sorted(missing))}")
+
+
+if __name__ == "__main__":
+    main()
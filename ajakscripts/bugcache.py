@@ -0,0 +1,271 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, \
+    as_completed, wait
+import itertools
+import json
+import sqlite3
+import time
+
+from ajakscripts import cache
+
+# Seconds a cache may go without a delta sync before reads trigger one
+DEFAULT_MAX_AGE = 900
+
+# last_change_time has second granularity and our clock isn't the
+# server's, so sync from a little before the last sync to be safe
+CLOCK_SKEW = 60
+
+# Aliases per alias search, every one of them ends up in the URL
+DEFAULT_CHUNK_SIZE = 200
+
+# Bugs per page of a paged search
+DEFAULT_PAGE_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bugs (
+    id INTEGER PRIMARY KEY,
+    last_change_time TEXT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS aliases (
+    alias TEXT PRIMARY KEY,
+    id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _unique(iterable):
+    seen = set()
+    for item in iterable:
+        if item and item not in seen:
+            seen.add(item)
+            yield item
+
+
+def _chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def query_all(bgo, query, page_size=DEFAULT_PAGE_SIZE) -> list:
+    """
+    Run a Bugzilla search page by page, returning every result. Pages are
+    ordered by bug id so none are skipped or repeated, and only an empty
+    page ends the search, since the server may cap limit below page_size.
+    """
+    bugs = []
+    while True:
+        results = bgo.query(dict(query, order="bug_id", limit=page_size,
+                                 offset=len(bugs)))
+        if not results:
+            return bugs
+        bugs += results
+
+
+class CachedBug:
+    """
+    Read-only bug built from a cached REST record, exposing the same
+    attributes as bugzilla.Bug for the fields we use
+    """
+
+    def __init__(self, url, data):
+        self._url = url
+        self.__dict__.update(data)
+
+    @property
+    def weburl(self):
+        return f"{self._url}/show_bug.cgi?id={self.id}"
+
+    def get_raw_data(self):
+        return {key: value for key, value in self.__dict__.items()
+                if not key.startswith("_")}
+
+
+class BugCache:
+    """
+    On-disk cache of bug records keyed by id and alias
+
+    Reads are served locally as long as the cache was synced in the last
+    max_age seconds, otherwise a last_change_time search first drops every
+    cached bug that changed since the previous sync, so the next read of it
+    goes to Bugzilla. get_bgo is only called when we actually need to talk
+    to Bugzilla.
+    """
+
+    def __init__(self, get_bgo, url, path=None, max_age=DEFAULT_MAX_AGE):
+        self._get_bgo = get_bgo
+        self.url = url
+        self.max_age = max_age
+        self.db = sqlite3.connect(path or cache.cache_path("bugs.sqlite"))
+        self.db.executescript(SCHEMA)
+
+    def _get_meta(self, key):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?",
+                              (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self.db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                        (key, str(value)))
+
+    def _store(self, bugs):
+        with self.db:
+            for bug in bugs:
+                data = bug.get_raw_data()
+                self.db.execute("INSERT OR REPLACE INTO bugs VALUES (?, ?, ?)",
+                                (data["id"], data.get("last_change_time"),
+                                 json.dumps(data, default=str)))
+                self.db.execute("DELETE FROM aliases WHERE id = ?",
+                                (data["id"],))
+                for alias in data.get("alias") or []:
+                    self.db.execute("INSERT OR REPLACE INTO aliases VALUES (?, ?)",
+                                    (alias, data["id"]))
+
+    def _load(self, bug_id):
+        row = self.db.execute("SELECT data FROM bugs WHERE id = ?",
+                              (bug_id,)).fetchone()
+        return CachedBug(self.url, json.loads(row[0])) if row else None
+
+    def _resolve(self, key):
+        if str(key).isdigit():
+            return int(key)
+        row = self.db.execute("SELECT id FROM aliases WHERE alias = ?",
+                              (key,)).fetchone()
+        return row[0] if row else None
+
+    def sync(self, force=False):
+        last_sync = self._get_meta("last_sync")
+        now = time.time()
+
+        # Everything that ends up in an empty cache is fresh, so there's
+        # nothing to catch up on yet
+        if last_sync is None:
+            with self.db:
+                self._set_meta("last_sync", now)
+            return
+
+        if not force and now - float(last_sync) < self.max_age:
+            return
+
+        since = time.gmtime(float(last_sync) - CLOCK_SKEW)
+        bgo = self._get_bgo()
+        # Only the ids, this covers every bug on the tracker and we just
+        # want to know which of ours went stale
+        query = bgo.build_query(include_fields=["id"])
+        query["last_change_time"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", since)
+        self.invalidate(bug.id for bug in query_all(bgo, query))
+
+        with self.db:
+            self._set_meta("last_sync", now)
+
+    def invalidate(self, ids):
+        with self.db:
+            for bug_id in ids:
+                bug_id = self._resolve(bug_id)
+                self.db.execute("DELETE FROM bugs WHERE id = ?", (bug_id,))
+                self.db.execute("DELETE FROM aliases WHERE id = ?", (bug_id,))
+
+    def getbugs(self, idlist, fresh=False):
+        """
+        Like Bugzilla.getbugs(), returns a list in the same order as idlist
+        with None for bugs that don't exist. fresh=True fetches every bug
+        from Bugzilla, for callers that are going to write back what they
+        read.
+        """
+        bugs = {}
+        missing = []
+        if fresh:
+            missing = list(idlist)
+        else:
+            self.sync()
+            for key in idlist:
+                bug_id = self._resolve(key)
+                bug = self._load(bug_id) if bug_id is not None else None
+                if bug:
+                    bugs[key] = bug
+                else:
+                    missing.append(key)
+
+        if missing:
+            fetched = [bug for bug in self._get_bgo().getbugs(missing) if bug]
+            self._store(fetched)
+            for key in missing:
+                bug_id = self._resolve(key)
+                if bug_id is not None:
+                    bugs[key] = self._load(bug_id)
+
+        return [bugs.get(key) for key in idlist]
+
+    def getbug(self, id_or_alias, fresh=False):
+        bug = self.getbugs([id_or_alias], fresh)[0]
+        if bug is None:
+            # Let Bugzilla raise the same error it always has
+            self._get_bgo().getbug(id_or_alias)
+        return bug
+
+    def _fetch_aliases(self, aliases):
+        bgo = self._get_bgo()
+        return bgo.query(bgo.build_query(alias=aliases))
+
+    def iter_aliases(self, aliases, chunk_size=DEFAULT_CHUNK_SIZE, jobs=4):
+        """
+        Resolve aliases, which may be any iterable (e.g. a stream), chunk_size
+        at a time. Aliases we don't have cached are queried for with up to
+        jobs queries in flight, and (chunk, bugs, missing) is yielded as soon
+        as each chunk is done, so chunks can come out of order.
+        """
+        self.sync()
+
+        def finish(chunk, found, fetched):
+            self._store(fetched)
+            for bug in fetched:
+                found[bug.id] = self._load(bug.id)
+            missing = [alias for alias in chunk
+                       if self._resolve(alias) is None]
+            return chunk, list(found.values()), missing
+
+        chunks = _chunked(_unique(aliases), chunk_size)
+        # future -> (chunk, bugs found locally)
+        pending = {}
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            for chunk in chunks:
+                found = {}
+                unknown = []
+                for alias in chunk:
+                    bug_id = self._resolve(alias)
+                    if bug_id is not None:
+                        found[bug_id] = self._load(bug_id)
+                    else:
+                        unknown.append(alias)
+
+                if not unknown:
+                    yield chunk, list(found.values()), []
+                    continue
+
+                future = executor.submit(self._fetch_aliases, unknown)
+                pending[future] = chunk, found
+
+                # Don't read further ahead than we have workers for
+                if len(pending) >= jobs:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield finish(*pending.pop(future), future.result())
+
+            for future in as_completed(list(pending)):
+                yield finish(*pending.pop(future), future.result())
+
+    def query_aliases(self, aliases):
+        """
+        Return (bugs, missing) where bugs are the cached or fetched bugs
+        carrying any of aliases and missing are the aliases no bug has
+        """
+        found = {}
+        missing = []
+        for _, bugs, chunk_missing in self.iter_aliases(aliases):
+            found.update((bug.id, bug) for bug in bugs)
+            missing += chunk_missing
+        return list(found.values()), sorted(missing)
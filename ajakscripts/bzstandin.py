@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit
+import argparse
+import json
+import random
+import threading
+import time
+
+import requests
+
+# Never recorded and never part of the key a response is looked up by
+SECRET_PARAMS = {'Bugzilla_api_key', 'api_key'}
+SECRET_HEADERS = {'x-bugzilla-api-key', 'authorization', 'cookie'}
+# Response headers worth replaying, for conditional GETs
+RECORDED_HEADERS = ('ETag', 'Last-Modified')
+
+
+def parse_faults(spec) -> dict:
+    """Parse "429:0.1,503:0.05" into {429: 0.1, 503: 0.05}"""
+    faults = {}
+    for fault in filter(None, (spec or '').split(',')):
+        status, probability = fault.split(':')
+        faults[int(status)] = float(probability)
+    return faults
+
+
+def request_key(method, path, query):
+    params = sorted((key, value) for key, value in parse_qsl(query, True)
+                    if key not in SECRET_PARAMS)
+    return f"{method} {path}?{urlencode(params)}"
+
+
+class Fixtures:
+    """
+    Recorded responses, looked up by method, path and query string.
+    Writes (PUT/POST) fall back to any response recorded for the same
+    method and path since their bodies rarely match exactly.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.responses = {}
+        if path:
+            try:
+                with open(path) as f:
+                    self.responses = json.load(f)
+            except FileNotFoundError:
+                pass
+
+    def lookup(self, method, path, query):
+        response = self.responses.get(request_key(method, path, query))
+        if response is None and method in ('PUT', 'POST'):
+            response = self.responses.get(f"{method} {path}?")
+        return response
+
+    def record(self, method, path, query, response):
+        with self.lock:
+            self.responses[request_key(method, path, query)] = response
+            if method in ('PUT', 'POST'):
+                self.responses.setdefault(f"{method} {path}?", response)
+
+    def save(self):
+        if self.path:
+            with open(self.path, 'w') as f:
+                json.dump(self.responses, f, indent=1, sort_keys=True)
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.bytes_in = 0
+            self.bytes_out = 0
+            self.faults = 0
+            self.endpoints = {}
+
+    def add(self, method, path, bytes_in, bytes_out, fault=False):
+        with self.lock:
+            self.requests += 1
+            self.faults += fault
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            endpoint = f"{method} {path}"
+            self.endpoints[endpoint] = self.endpoints.get(endpoint, 0) + 1
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                'requests': self.requests,
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'faults': self.faults,
+                'endpoints': dict(self.endpoints),
+            }
+
+
+class Handler(BaseHTTPRequestHandler):
+    # Set on the subclass StandIn creates
+    standin = None
+
+    def log_message(self, format, *args):
+        if self.standin.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return len(body)
+
+    def _send_json(self, status, data):
+        return self._send(status, json.dumps(data).encode(),
+                          {'Content-Type': 'application/json'})
+
+    def _proxy(self, method, body):
+        # Always ask for the full response, so a 304 never ends up recorded
+        # in place of the document
+        headers = {key: value for key, value in self.headers.items()
+                   if key.lower() not in ('host', 'content-length',
+                                          'if-none-match',
+                                          'if-modified-since')}
+        response = requests.request(method, self.standin.upstream + self.path,
+                                    headers=headers, data=body)
+        return {
+            'status': response.status_code,
+            'content_type': response.headers.get('Content-Type',
+                                                 'application/json'),
+            'headers': {key: response.headers[key]
+                        for key in RECORDED_HEADERS
+                        if key in response.headers},
+            'body': response.text,
+        }
+
+    def _not_modified(self, response):
+        """Whether the request's validators match the recorded response"""
+        headers = response.get('headers', {})
+        if 'If-None-Match' in self.headers:
+            return self.headers['If-None-Match'] == headers.get('ETag')
+        return 'If-Modified-Since' in self.headers and \
+            self.headers['If-Modified-Since'] == headers.get('Last-Modified')
+
+    def _handle(self, method):
+        url = urlsplit(self.path)
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+        if url.path == '/__stats__':
+            self._send_json(200, self.standin.stats.as_dict())
+            return
+        if url.path == '/__reset__':
+            self.standin.stats.reset()
+            self._send_json(200, {})
+            return
+
+        if self.standin.latency:
+            time.sleep(self.standin.latency)
+
+        # Injected faults happen before the request gets anywhere, like a
+        # proxy in front of Bugzilla throttling or falling over
+        status = self.standin.fault()
+        if status:
+            sent = self._send(status, json.dumps({
+                'error': True,
+                'code': status,
+                'message': "Injected fault",
+            }).encode(), {'Content-Type': 'application/json',
+                          'Retry-After': '0'})
+            self.standin.stats.add(method, url.path, len(body), sent, True)
+            return
+
+        if self.standin.upstream:
+            response = self._proxy(method, body)
+            self.standin.fixtures.record(method, url.path, url.query, response)
+        else:
+            response = self.standin.fixtures.lookup(method, url.path, url.query)
+
+        if response is None:
+            sent = self._send_json(404, {
+                'error': True,
+                'code': 404,
+                'message': f"No recorded response for {method} {self.path}",
+            })
+        elif response['status'] == 200 and self._not_modified(response):
+            sent = self._send(304, b'', response.get('headers'))
+        else:
+            headers = dict(response.get('headers', {}))
+            headers['Content-Type'] = response['content_type']
+            sent = self._send(response['status'], response['body'].encode(),
+                              headers)
+
+        self.standin.stats.add(method, url.path, len(body), sent)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+
+class StandIn:
+    """
+    Local stand-in for the Bugzilla REST API that replays recorded
+    responses, or records them when given an upstream to proxy to. Point
+    the tools at it with GBUGS_URL=<StandIn.url>.
+
+    Nothing in it is specific to Bugzilla, it stands in for the MSRC CVRF
+    API just as well (msft-cve-fix-version.py --base-url
+    <StandIn.url>/cvrf/v2.0/), and answers conditional GETs against the
+    ETag and Last-Modified it recorded.
+    """
+
+    def __init__(self, fixtures=None, upstream=None, latency=0, port=0,
+                 verbose=False, faults=None, seed=None):
+        self.fixtures = Fixtures(fixtures)
+        self.upstream = upstream.rstrip('/') if upstream else None
+        self.latency = latency
+        self.faults = faults or {}
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.verbose = verbose
+        self.stats = Stats()
+
+        handler = type('StandInHandler', (Handler,), {'standin': self})
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+        self.thread = None
+
+    def fault(self):
+        """Return an error status to answer with instead, or None"""
+        with self.random_lock:
+            roll = self.random.random()
+        for status, probability in self.faults.items():
+            if roll < probability:
+                return status
+            roll -= probability
+        return None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.upstream:
+            self.fixtures.save()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Local Bugzilla REST (or MSRC CVRF) stand-in replaying "
+                    "recorded responses")
+    parser.add_argument('-f', '--fixtures', type=str, required=True,
+                        help="JSON file to replay from or record to")
+    parser.add_argument('-r', '--record', type=str, metavar='UPSTREAM',
+                        help="proxy to UPSTREAM and record its responses")
+    parser.add_argument('-l', '--latency', type=float, default=0,
+                        help="milliseconds to wait before every response")
+    parser.add_argument('-p', '--port', type=int, default=8080)
+    parser.add_argument('-F', '--faults', type=parse_faults, default={},
+                        help="answer a share of requests with errors instead, "
+                             "e.g. 429:0.1,503:0.05")
+    parser.add_argument('-s', '--seed', type=int,
+                        help="seed for --faults, to make runs repeatable")
+    parser.add_argument('-v', '--verbose', action='store_true', default=False)
+    args = parser.parse_args()
+
+    standin = StandIn(args.fixtures, upstream=args.record,
+                      latency=args.latency / 1000, port=args.port,
+                      verbose=args.verbose, faults=args.faults,
+                      seed=args.seed)
+    print(f"Serving on {standin.url}, use GBUGS_URL={standin.url}")
+    try:
+        standin.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        standin.server.server_close()
+        if standin.upstream:
+            standin.fixtures.save()
+
+
+if __name__ == "__main__":
+    main()
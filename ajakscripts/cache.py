@@ -0,0 +1,71 @@
+import json
+import os
+import subprocess
+
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME",
+                                        os.path.expanduser("~/.cache")),
+                         "ajakscripts")
+
+
+def cache_path(name):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    return os.path.join(CACHE_DIR, name)
+
+
+def repo_revision(repo_path):
+    """
+    Return something identifying the current state of an ebuild repository
+    to key derived indexes on: the git HEAD for git checkouts, the commit
+    recorded by the rsync mirrors, or failing both the newest mtime of its
+    category and md5-cache directories. None only if repo_path is missing.
+    """
+    try:
+        return subprocess.run(['git', '-C', repo_path, 'rev-parse', 'HEAD'],
+                              capture_output=True, check=True,
+                              text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+
+    try:
+        with open(os.path.join(repo_path, 'metadata', 'timestamp.commit')) as f:
+            return f.read().split()[0]
+    except (OSError, IndexError):
+        pass
+
+    # Adding, removing or regenerating an ebuild renames something in one
+    # of these, which is what bumps a directory's mtime
+    md5_cache = os.path.join(repo_path, 'metadata', 'md5-cache')
+    mtimes = []
+    for parent in (repo_path, md5_cache):
+        try:
+            with os.scandir(parent) as entries:
+                mtimes += [entry.stat().st_mtime_ns for entry in entries
+                           if entry.is_dir() and not entry.name.startswith('.')]
+            mtimes.append(os.stat(parent).st_mtime_ns)
+        except OSError:
+            continue
+    return f"mtime-{max(mtimes)}" if mtimes else None
+
+
+def load_index(name, revision):
+    """Load a JSON index saved by save_index() if it was built at revision"""
+    if revision is None:
+        return None
+    try:
+        with open(cache_path(name)) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get('revision') != revision:
+        return None
+    return data['index']
+
+
+def save_index(name, revision, index):
+    if revision is None:
+        return
+    # Write and rename so a concurrent reader never sees half an index
+    path = cache_path(name)
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'revision': revision, 'index': index}, f)
+    os.replace(path + '.tmp', path)
@@ -0,0 +1,189 @@
+"""
+Entry points that hand the command to a running ajakscripts-daemon, or run
+it here if there isn't one. Only the standard library may be imported at
+the top of this module, not loading pkgcore and friends is the whole point.
+"""
+
+import importlib
+import io
+import json
+import os
+import socket
+import stat
+import sys
+
+SOCKET_PATH = os.environ.get("AJAKSCRIPTS_SOCKET") or os.path.join(
+    os.environ.get("XDG_RUNTIME_DIR") or "/tmp",
+    f"ajakscripts-{os.getuid()}.sock")
+
+# Commands that never prompt, so their whole run can happen in the daemon
+FORWARDED = {
+    "ajakscripts.bscve",
+    "ajakscripts.cvesearch",
+    "ajakscripts.glsaalldone",
+    "ajakscripts.pkgmatch",
+    "ajakscripts.revdeps",
+    "ajakscripts.secsweep",
+}
+
+# Commands that prompt only have these (module, function) run in the
+# daemon: everything up to the editor, which stays with the client
+PREPARED = {
+    ("ajakscripts.secbugfile", "prepare_draft"),
+    ("ajakscripts.secbugfile", "prepare_drafts"),
+    ("ajakscripts.stablereq", "stablereq_params"),
+}
+
+# The daemon read these when it started, it only runs commands for clients
+# that agree on them
+FORWARDED_ENV = ("GBUGS_URL", "HOME", "XDG_CACHE_HOME")
+
+
+def _recv_all(sock):
+    chunks = []
+    while chunk := sock.recv(65536):
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+
+def _connect():
+    """Return a socket connected to the daemon, or None if there isn't one"""
+    if os.environ.get("AJAKSCRIPTS_NO_DAEMON"):
+        return None
+    try:
+        st = os.lstat(SOCKET_PATH)
+    except OSError:
+        return None
+
+    # Whoever is listening gets our input and decides what we print, and
+    # /tmp is anybody's. Only talk to a socket of ours nobody else can use.
+    if not stat.S_ISSOCK(st.st_mode) or st.st_uid != os.getuid() or \
+            st.st_mode & 0o077:
+        print(f"Not using {SOCKET_PATH}, it isn't a socket only we can "
+              "connect to", file=sys.stderr)
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(SOCKET_PATH)
+    except OSError:
+        # A stale socket from a daemon that's gone
+        sock.close()
+        return None
+    return sock
+
+
+def _request(module, argv=None, stdin=""):
+    return {
+        "module": module,
+        # So that usage messages name the command that was run
+        "prog": os.path.basename(sys.argv[0]),
+        "argv": sys.argv[1:] if argv is None else argv,
+        "cwd": os.getcwd(),
+        "env": {name: os.environ.get(name) for name in FORWARDED_ENV},
+        "tty": sys.stdin.isatty(),
+        "stdin": stdin,
+    }
+
+
+def _send(sock, request):
+    with sock:
+        sock.sendall(json.dumps(request).encode())
+        sock.shutdown(socket.SHUT_WR)
+        return json.loads(_recv_all(sock))
+
+
+def forward(module, argv=None):
+    """
+    Run module's main() with argv in the daemon, returning its exit status,
+    or None if there is no daemon to talk to
+    """
+    sock = _connect()
+    if sock is None:
+        return None
+
+    # Piped input is read up front, it can't be streamed to the daemon
+    tty = sys.stdin.isatty()
+    request = _request(module, argv, "" if tty else sys.stdin.read())
+
+    # Past this point the command may have run, don't run it twice
+    try:
+        reply = _send(sock, request)
+    except (OSError, ValueError) as e:
+        print(f"Lost ajakscripts-daemon mid-command: {e}", file=sys.stderr)
+        return 1
+
+    if "fallback" in reply:
+        # It didn't run, run it here instead on whatever we already read
+        print(reply["fallback"], file=sys.stderr)
+        if not tty:
+            sys.stdin = io.StringIO(request["stdin"])
+        return None
+
+    sys.stdout.write(reply["stdout"])
+    sys.stderr.write(reply["stderr"])
+    return reply["status"]
+
+
+def prepare(module, function, *args):
+    """
+    Return module.function(*args), called in the daemon if there is one
+    and here otherwise. args and the result have to survive a round trip
+    through JSON. If the function exits, so do we, with its status.
+    """
+    reply = None
+    sock = _connect()
+    if sock is not None:
+        request = _request(module)
+        request.update({"function": function, "args": args})
+        # Nothing gets filed or changed before the editor, so it's fine to
+        # redo whatever got lost here
+        try:
+            reply = _send(sock, request)
+        except (OSError, ValueError) as e:
+            print(f"Lost ajakscripts-daemon: {e}", file=sys.stderr)
+        else:
+            if "fallback" in reply:
+                print(reply["fallback"], file=sys.stderr)
+                reply = None
+
+    if reply is None:
+        return getattr(importlib.import_module(module), function)(*args)
+
+    sys.stdout.write(reply["stdout"])
+    sys.stderr.write(reply["stderr"])
+    if "result" not in reply:
+        sys.exit(reply["status"])
+    return reply["result"]
+
+
+def run(module):
+    status = forward(module) if module in FORWARDED else None
+    if status is None:
+        importlib.import_module(module).main()
+    else:
+        sys.exit(status)
+
+
+def bscve():
+    run("ajakscripts.bscve")
+
+
+def cvesearch():
+    run("ajakscripts.cvesearch")
+
+
+def glsaalldone():
+    run("ajakscripts.glsaalldone")
+
+
+def pkgmatch():
+    run("ajakscripts.pkgmatch")
+
+
+def revdeps():
+    run("ajakscripts.revdeps")
+
+
+def secsweep():
+    run("ajakscripts.secsweep")
@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+
+from ajakscripts import cache, profiling
+
+CVELIST_DIR = os.path.expanduser("~/gentoo/cvelist")
+
+# Bump whenever the tables below or what _parse() stores change, the index
+# is rebuilt from scratch on mismatch
+SCHEMA_VERSION = 3
+
+# cves_fts is the inverted index over descriptions and vendor/product names
+# that cve-search queries, both tables share the rowid from _rowid()
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cves (
+    num INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    path TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    published TEXT,
+    description TEXT NOT NULL,
+    products TEXT NOT NULL,
+    refs TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cves_path ON cves (path);
+CREATE VIRTUAL TABLE IF NOT EXISTS cves_fts USING fts5 (
+    description, products
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _parse_legacy(data):
+    # CVE JSON 4.0, as found in the old CVEProject/cvelist repository
+    meta = data['CVE_data_meta']
+    descs = data.get('description', {}).get('description_data', [])
+    refs = data.get('references', {}).get('reference_data', [])
+
+    products = []
+    for vendor in data.get('affects', {}).get('vendor', {}).get('vendor_data', []):
+        for product in vendor.get('product', {}).get('product_data', []):
+            products.append((vendor.get('vendor_name', ''),
+                             product.get('product_name', '')))
+
+    rejected = meta.get('STATE') == 'REJECT'
+    return meta['ID'], meta.get('DATE_PUBLIC'), descs, refs, products, rejected
+
+
+def _parse_v5(data):
+    # CVE JSON 5, as found in CVEProject/cvelistV5
+    meta = data['cveMetadata']
+    cna = data.get('containers', {}).get('cna', {})
+    descs = cna.get('descriptions') or cna.get('rejectedReasons') or []
+    refs = cna.get('references', [])
+
+    products = [(affected.get('vendor', ''), affected.get('product', ''))
+                for affected in cna.get('affected', [])]
+
+    rejected = meta.get('state') == 'REJECTED'
+    return (meta['cveId'], meta.get('datePublished'), descs, refs, products,
+            rejected)
+
+
+def _parse(path):
+    with open(path, 'rb') as f:
+        data = json.loads(f.read())
+
+    if 'cveMetadata' in data:
+        parsed = _parse_v5(data)
+    else:
+        parsed = _parse_legacy(data)
+    cve_id, published, descs, refs, products, rejected = parsed
+    products = [tuple(name if name != 'n/a' else '' for name in pair)
+                for pair in products]
+
+    # Prefer the English description, but take whatever there is
+    english = [desc['value'] for desc in descs
+               if desc.get('lang', 'en').startswith('en')]
+    others = [desc['value'] for desc in descs]
+    description = (english or others or [''])[0]
+
+    return {
+        'id': cve_id,
+        # Only keep the date, some records carry a full timestamp
+        'published': published[:10] if published else None,
+        'description': description,
+        # One "vendor<TAB>product" line per affected product
+        'products': '\n'.join('\t'.join(pair) for pair in products
+                               if any(pair)),
+        'references': [ref['url'] for ref in refs if 'url' in ref],
+        'rejected': rejected,
+    }
+
+
+def _rowid(cve_id):
+    # CVE-2021-1234 -> 2021000001234, unique and stable across rebuilds
+    _, year, num = cve_id.split('-')
+    return int(year) * 10**9 + int(num)
+
+
+def _is_cve_file(path):
+    name = os.path.basename(path)
+    return name.startswith('CVE-') and name.endswith('.json')
+
+
+def _walk(cvelist):
+    for root, dirs, files in os.walk(cvelist):
+        # Don't descend into .git and friends
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        for name in files:
+            if _is_cve_file(name):
+                yield os.path.join(root, name)
+
+
+def _git_head(cvelist):
+    try:
+        return subprocess.run(['git', '-C', cvelist, 'rev-parse', 'HEAD'],
+                              capture_output=True, check=True,
+                              text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _git_changed(cvelist, old, new):
+    try:
+        stdout = subprocess.run(['git', '-C', cvelist, 'diff', '--name-only',
+                                 old, new],
+                                capture_output=True, check=True,
+                                text=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return [os.path.join(cvelist, path) for path in stdout.splitlines()
+            if _is_cve_file(path)]
+
+
+class CveIndex:
+    """
+    Compact SQLite index of a cvelist checkout holding only what we need
+    from each record: ID, publication date, description, vendor/product
+    names and reference URLs, plus a full-text index for cve-search
+
+    update() only reparses records that changed since the last build, using
+    git diff when the checkout is a git repository and file mtimes otherwise
+    """
+
+    def __init__(self, cvelist=CVELIST_DIR, path=None):
+        self.cvelist = cvelist
+        self.db = sqlite3.connect(path or cache.cache_path("cvelist.sqlite"))
+        self.db.executescript(SCHEMA)
+
+        if self._get_meta('schema') != str(SCHEMA_VERSION):
+            self._reset()
+
+    def _get_meta(self, key):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?",
+                              (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self.db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                        (key, str(value)))
+
+    def _reset(self):
+        with self.db:
+            self.db.execute("DROP TABLE IF EXISTS cves")
+            self.db.execute("DROP TABLE IF EXISTS cves_fts")
+            self.db.execute("DELETE FROM meta")
+        self.db.executescript(SCHEMA)
+        with self.db:
+            self._set_meta('schema', SCHEMA_VERSION)
+
+    def _index_file(self, path):
+        record = _parse(path)
+        rowid = _rowid(record['id'])
+        self.db.execute("INSERT OR REPLACE INTO cves "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (rowid, record['id'], path, os.stat(path).st_mtime,
+                         record['published'], record['description'],
+                         record['products'], json.dumps(record['references'])))
+
+        self.db.execute("DELETE FROM cves_fts WHERE rowid = ?", (rowid,))
+        # Rejected CVEs can still be looked up, but never show up in searches
+        if not record['rejected']:
+            self.db.execute("INSERT INTO cves_fts (rowid, description, products) "
+                            "VALUES (?, ?, ?)",
+                            (rowid, record['description'], record['products']))
+
+    def _remove_path(self, path):
+        for (rowid,) in self.db.execute("SELECT num FROM cves WHERE path = ?",
+                                        (path,)).fetchall():
+            self.db.execute("DELETE FROM cves_fts WHERE rowid = ?", (rowid,))
+        self.db.execute("DELETE FROM cves WHERE path = ?", (path,))
+
+    def _update_paths(self, paths):
+        count = 0
+        for path in paths:
+            if not os.path.exists(path):
+                self._remove_path(path)
+            else:
+                try:
+                    self._index_file(path)
+                except (OSError, ValueError, KeyError, TypeError,
+                        AttributeError) as e:
+                    # One broken record shouldn't cost us the rest, and its
+                    # old contents are no better than none
+                    print(f"Skipping {path}: {e!r}", file=sys.stderr)
+                    self._remove_path(path)
+                    continue
+            count += 1
+        return count
+
+    def _update_mtimes(self):
+        mtimes = dict(self.db.execute("SELECT path, mtime FROM cves"))
+        changed = []
+        for path in _walk(self.cvelist):
+            if mtimes.pop(path, None) != os.stat(path).st_mtime:
+                changed.append(path)
+        # Whatever wasn't seen on disk has been removed
+        return self._update_paths(changed + list(mtimes))
+
+    @profiling.timed('cveindex.update')
+    def update(self):
+        """Bring the index up to date, returning how many records changed"""
+        old_head = self._get_meta('head')
+        head = _git_head(self.cvelist)
+
+        with self.db:
+            changed = None
+            if head and old_head:
+                if head == old_head:
+                    return 0
+                changed = _git_changed(self.cvelist, old_head, head)
+
+            if changed is None:
+                count = self._update_mtimes()
+            else:
+                count = self._update_paths(changed)
+
+            if head:
+                self._set_meta('head', head)
+
+        return count
+
+    @profiling.timed('cveindex.lookup')
+    def lookup(self, cves):
+        """Return a dict of CVE ID -> record for the CVEs we know about"""
+        cves = list(cves)
+        found = {}
+        # Stay well below SQLite's limit on bound parameters
+        for i in range(0, len(cves), 500):
+            chunk = cves[i:i + 500]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self.db.execute("SELECT id, description, refs, products "
+                                   f"FROM cves WHERE id IN ({placeholders})",
+                                   chunk)
+            for cve_id, description, refs, products in rows:
+                found[cve_id] = {
+                    'id': cve_id,
+                    'description': description,
+                    'references': json.loads(refs),
+                    # (vendor, product) pairs, either may be empty
+                    'products': [tuple(line.split('\t', 1))
+                                 for line in products.splitlines()],
+                }
+        return found
+
+    @profiling.timed('cveindex.search')
+    def search(self, terms, since=None):
+        """
+        Return (id, published, description) of every CVE whose description
+        or vendor/product names contain all of terms, most recently
+        published first, undated ones last. With since (YYYY-MM-DD), only
+        CVEs published on or after it, so undated ones are left out.
+        """
+        # Quote each term so FTS5 treats "libjpeg-turbo" as a phrase instead
+        # of trying to parse it as query syntax
+        match = ' '.join('"{}"'.format(term.replace('"', '""'))
+                         for term in terms)
+        query = ("SELECT cves.id, cves.published, cves.description "
+                 "FROM cves_fts JOIN cves ON cves.num = cves_fts.rowid "
+                 "WHERE cves_fts MATCH ?")
+        params = [match]
+        if since:
+            query += " AND cves.published >= ?"
+            params.append(since)
+        # NULLs sort last descending, ties go to the higher CVE number
+        query += " ORDER BY cves.published DESC, cves_fts.rowid DESC"
+        return self.db.execute(query, params).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-d', '--cvelist', type=str, default=CVELIST_DIR)
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    profiling.setup(args)
+
+    index = CveIndex(args.cvelist)
+    count = index.update()
+    print(f"Updated {count} records")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+
+import argparse
+import sys
+
+from ajakscripts import gbugs, profiling
+from ajakscripts.cveindex import CVELIST_DIR, CveIndex
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Find CVEs mentioning a package that don't have a bug yet")
+    parser.add_argument('-s', '--since', type=str, required=False,
+                        help="only CVEs published on or after YYYY-MM-DD, which "
+                             "leaves out CVEs without a publication date")
+    parser.add_argument('-a', '--all', action='store_true', default=False,
+                        help="also list CVEs that already have a bug")
+    parser.add_argument('-u', '--update', action='store_true', default=False,
+                        help="update the cvelist index before searching")
+    parser.add_argument('-d', '--cvelist', type=str, default=CVELIST_DIR)
+    parser.add_argument('terms', nargs='+')
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    profiling.setup(args)
+
+    index = CveIndex(args.cvelist)
+    if args.update:
+        index.update()
+
+    # "cat/pkg" searches for the package name
+    terms = [term.split('/')[-1] for term in args.terms]
+    results = index.search(terms, since=args.since)
+
+    if not results:
+        print("No matching CVEs")
+        sys.exit(1)
+
+    if not args.all:
+        _, unfiled = gbugs.query_aliases([cve for cve, _, _ in results])
+        unfiled = set(unfiled)
+        results = [result for result in results if result[0] in unfiled]
+
+    for cve, published, desc in results:
+        print(f"{cve} {published or '?'}: {desc}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+
+from contextlib import redirect_stderr, redirect_stdout
+import argparse
+import functools
+import importlib
+import io
+import json
+import os
+import socketserver
+import sys
+import traceback
+
+from ajakscripts import cache, gbugs, maintindex, profiling, repos
+from ajakscripts.client import FORWARDED, FORWARDED_ENV, PREPARED, \
+    SOCKET_PATH
+
+
+class _Stdin(io.StringIO):
+    """The client's stdin, claiming to be a terminal if the client's was"""
+
+    def __init__(self, text, tty):
+        super().__init__(text)
+        self.tty = tty
+
+    def isatty(self):
+        return self.tty
+
+
+def _memoized():
+    """Everything holding state derived from the repository"""
+    funcs = [repos.get_config, repos.get_repo, repos.repo_path, repos.match,
+             maintindex.get_index]
+    for name, attr in (('pkgmatch', 'get_matcher'), ('pycompat', 'get_index'),
+                       ('revdeps', 'get_index')):
+        module = sys.modules.get('ajakscripts.' + name)
+        if module:
+            funcs.append(getattr(module, attr))
+    return funcs
+
+
+class Daemon:
+    def __init__(self, repo_path=None):
+        self.repo_path = repo_path or repos.repo_path()
+        self.revision = None
+
+    def warm(self):
+        """Load what every command would otherwise load for itself"""
+        self.revision = cache.repo_revision(self.repo_path)
+        for module in sorted(FORWARDED | {m for m, _ in PREPARED}):
+            importlib.import_module(module)
+        gbugs.get_bgo()
+        gbugs.get_cache()
+        maintindex.get_index(self.repo_path)
+        try:
+            repos.get_repo()
+        except Exception as e:
+            # Not every command needs pkgcore, don't refuse to start
+            print(f"Not preloading pkgcore: {e!r}", file=sys.stderr)
+
+    def check_revision(self):
+        """Drop everything derived from the repository if it moved on"""
+        revision = cache.repo_revision(self.repo_path)
+        if revision != self.revision:
+            print(f"Repository now at {revision}, reloading", file=sys.stderr)
+            for func in _memoized():
+                func.cache_clear()
+            self.revision = revision
+
+    def run(self, request) -> dict:
+        """
+        Run a command's main(), or with "function" in the request just that
+        function of its module. A reply with "fallback" asks the client to
+        run it itself.
+        """
+        # gbugs, cache and friends read these once, at import
+        env = {name: os.environ.get(name) for name in FORWARDED_ENV}
+        if request.get('env') != env:
+            return {'fallback': "ajakscripts-daemon runs with a different "
+                                "GBUGS_URL, HOME or XDG_CACHE_HOME, running "
+                                "here instead"}
+
+        function = request.get('function')
+        if function:
+            allowed = (request['module'], function) in PREPARED
+        else:
+            allowed = request['module'] in FORWARDED
+        if not allowed:
+            name = request['module'] + (f".{function}" if function else "")
+            return {'status': 2, 'stdout': '',
+                    'stderr': f"{name} can't run in the daemon\n"}
+
+        self.check_revision()
+        module = importlib.import_module(request['module'])
+        if function:
+            func = functools.partial(getattr(module, function),
+                                     *request['args'])
+        else:
+            func = module.main
+
+        stdout, stderr = io.StringIO(), io.StringIO()
+        saved = sys.argv, sys.stdin, os.getcwd()
+        status = 0
+        reply = {}
+        profiling.reset()
+        try:
+            sys.argv = [request['prog']] + request['argv']
+            sys.stdin = _Stdin(request['stdin'], request['tty'])
+            os.chdir(request['cwd'])
+            with redirect_stdout(stdout), redirect_stderr(stderr):
+                try:
+                    result = func()
+                    if function:
+                        reply['result'] = result
+                except SystemExit as e:
+                    if isinstance(e.code, str):
+                        print(e.code, file=sys.stderr)
+                        status = 1
+                    else:
+                        status = e.code or 0
+                except Exception:
+                    traceback.print_exc()
+                    status = 1
+                finally:
+                    profiling.finish()
+        finally:
+            sys.argv, sys.stdin = saved[:2]
+            os.chdir(saved[2])
+
+        reply.update({'status': status, 'stdout': stdout.getvalue(),
+                      'stderr': stderr.getvalue()})
+        return reply
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        request = json.loads(self.rfile.read())
+        reply = self.server.runner.run(request)
+        self.wfile.write(json.dumps(reply).encode())
+
+
+class Server(socketserver.UnixStreamServer):
+    # Commands run one at a time, they share sys.stdout and friends
+    def __init__(self, path, runner):
+        self.runner = runner
+        # Only we get to connect, and so run commands as us
+        umask = os.umask(0o177)
+        try:
+            super().__init__(path, Handler)
+        finally:
+            os.umask(umask)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Keep repository indexes and Bugzilla sessions loaded "
+                    "for bscve, cve-search, glsa-all-done, pkg-match, "
+                    "revdepless and secbug-sweep to use, and to prepare "
+                    "secbug-file and stablereq-file.py drafts in")
+    parser.add_argument('-r', '--repo', type=str,
+                        help="defaults to pkgcore's gentoo repo")
+    parser.add_argument('-s', '--socket', type=str, default=SOCKET_PATH,
+                        help="clients look for AJAKSCRIPTS_SOCKET, or this "
+                             "default")
+    args = parser.parse_args()
+
+    daemon = Daemon(args.repo)
+    daemon.warm()
+
+    if os.path.exists(args.socket):
+        os.unlink(args.socket)
+    with Server(args.socket, daemon) as server:
+        print(f"Listening on {args.socket}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(args.socket)
+
+
+if __name__ == "__main__":
+    main()
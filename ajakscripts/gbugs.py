@@ -1,49 +1,185 @@
 from configparser import ConfigParser
+import functools
 import os
+import time
 
 from bugzilla import Bugzilla
-import pkgcore.config
-from pkgcore.ebuild import atom as atom_mod
 import requests
 
-BZ_BUG_API = "https://bugs.gentoo.org/rest/bug"
+from ajakscripts import bugcache, maintindex, profiling, repos, transport
+from ajakscripts.bugcache import BugCache, CLOCK_SKEW, DEFAULT_CHUNK_SIZE, \
+    DEFAULT_MAX_AGE, DEFAULT_PAGE_SIZE
 
+# GBUGS_URL points everything at another Bugzilla, e.g. a local stand-in
+BZ_URL = os.environ.get("GBUGS_URL", "https://bugs.gentoo.org").rstrip("/")
+BZ_BUG_API = BZ_URL + "/rest/bug"
 
-def get_api_key():
+# Created on first use by get_session()/get_bgo() so that importing this
+# module (and running --help) doesn't cost a connection to bugs.gentoo.org
+_session = None
+_bgo = None
+_cache = None
+
+
+class BugzillaError(Exception):
+    pass
+
+
+@functools.lru_cache(maxsize=None)
+def get_config():
     bugzrc = os.path.expanduser("~/.bugzrc")
     config = ConfigParser()
     config.read(bugzrc)
-    apikey = config['default']['key']
-    return apikey
+    return config
 
 
-def cp_atom(atom_str):
-    repo = pkgcore.config.load_config().repo['gentoo']
-    atom = atom_mod.atom(atom_str)
-    return repo.match(atom)
+def get_api_key():
+    return get_config()['default']['key']
 
 
-def atom_maints(atom) -> list:
-    # Get list of strings per maintainer object
-    strings = [str(maint) for maint in atom.maintainers]
+def get_session():
+    global _session
+    if _session is None:
+        # Everything talking to Bugzilla shares this one, so the rate limit
+        # and connection cap hold across threads and the python-bugzilla
+        # client alike
+        config = get_config()['default']
+        _session = transport.Session(
+            rate=config.getfloat('rate_limit', transport.DEFAULT_RATE),
+            max_per_host=config.getint('max_connections',
+                                       transport.DEFAULT_MAX_PER_HOST))
+        profiling.wrap(_session, ['request'], 'http')
+    return _session
+
+
+def get_bgo():
+    global _bgo
+    if _bgo is None:
+        # Constructing the client already does a round trip to check the
+        # server version
+        with profiling.span('bugzilla.connect'):
+            _bgo = Bugzilla(BZ_URL, api_key=get_api_key(), force_rest=True,
+                            requests_session=get_session())
+        profiling.wrap(_bgo, ['getbug', 'getbugs', 'query', 'update_bugs'],
+                       'bugzilla')
+    return _bgo
+
 
-    # Slice off the name, get the <email>
-    mails = [maint.split(" ")[-1] for maint in strings]
+def get_cache():
+    global _cache
+    if _cache is None:
+        max_age = get_config()['default'].getint('cache_max_age',
+                                                 DEFAULT_MAX_AGE)
+        _cache = BugCache(get_bgo, BZ_URL, max_age=max_age)
+    return _cache
 
-    # Return list of plain emails
-    mails = [mail.replace("<", "").replace(">", "") for mail in mails]
 
-    if len(mails) > 0:
-        return mails
-    else:
-        return ["maintainer-needed@gentoo.org"]
+def getbug(id_or_alias, fresh=False):
+    return get_cache().getbug(id_or_alias, fresh)
 
 
-def file_bug(params):
-    params["Bugzilla_api_key"] = get_api_key()
-    params["version"] = "unspecified"
+def getbugs(idlist, fresh=False):
+    return get_cache().getbugs(idlist, fresh)
 
-    return requests.post(BZ_BUG_API, data=params)
 
+def query_aliases(aliases):
+    return get_cache().query_aliases(aliases)
 
-bgo = Bugzilla("https://bugs.gentoo.org", api_key=get_api_key())
+
+def iter_aliases(aliases, chunk_size=DEFAULT_CHUNK_SIZE, jobs=4):
+    return get_cache().iter_aliases(aliases, chunk_size, jobs)
+
+
+def query_all(query, page_size=DEFAULT_PAGE_SIZE):
+    return bugcache.query_all(get_bgo(), query, page_size)
+
+
+def update_bugs(ids, updates):
+    ret = get_bgo().update_bugs(ids, updates)
+    # Don't serve our own stale copies until the next sync catches up
+    get_cache().invalidate(ids)
+    return ret
+
+
+def cp_atom(atom_str):
+    return repos.match(atom_str)
+
+
+def atom_maints(atom) -> list:
+    return maintindex.maintainers(atom.key)
+
+
+def find_filed(params, since) -> list:
+    """
+    Return the ids of bugs created since (a timestamp) with the summary,
+    product and component params would file a bug with. Raises
+    BugzillaError if we can't tell.
+    """
+    query = {
+        "summary": params["summary"],
+        "creation_time": time.strftime("%Y-%m-%dT%H:%M:%SZ",
+                                       time.gmtime(since)),
+        "include_fields": "id,summary",
+    }
+    for field in ("product", "component"):
+        if field in params:
+            query[field] = params[field]
+
+    try:
+        # Without the key, restricted (security) bugs never show up and
+        # we'd file them again. A header keeps it out of error messages.
+        response = get_session().get(
+            BZ_BUG_API, params=query,
+            headers={"X-BUGZILLA-API-KEY": get_api_key()})
+        response.raise_for_status()
+        bugs = response.json()["bugs"]
+    except (requests.RequestException, ValueError, KeyError) as e:
+        raise BugzillaError(
+            f"Couldn't check whether the bug got filed: {e}") from e
+    # summary is a substring search
+    return [bug["id"] for bug in bugs if bug["summary"] == params["summary"]]
+
+
+@profiling.timed('file_bug')
+def file_bug(params) -> int:
+    """
+    File a bug, returning its id. If we can't tell whether Bugzilla created
+    it (a server error or a dropped connection), look for it before trying
+    again so that retrying never files a duplicate, and give up if even
+    that fails.
+    """
+    params = dict(params, Bugzilla_api_key=get_api_key(),
+                  version="unspecified")
+    session = get_session()
+    since = time.time() - CLOCK_SKEW
+
+    for attempt in range(session.retries + 1):
+        try:
+            # 429s and connections that never got set up are still retried,
+            # nothing was filed for those
+            response = session.post(BZ_BUG_API, data=params, retry=False)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            response, error = None, e
+        else:
+            if response.status_code < 500:
+                data = response.json()
+                if "id" in data:
+                    return data["id"]
+                raise BugzillaError(data.get("message", response.text))
+            error = f"HTTP {response.status_code}"
+
+        filed = find_filed(params, since)
+        if filed:
+            return filed[0]
+        if attempt < session.retries:
+            session.delay(attempt, response)
+
+    raise BugzillaError(f"Filing failed: {error}")
+
+
+def __getattr__(name):
+    # "from ajakscripts.gbugs import bgo" used to be the way to get a client,
+    # keep it working but only connect when somebody actually asks for it
+    if name == "bgo":
+        return get_bgo()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,12 +1,13 @@
 #!/usr/bin/env python
 
+import argparse
+import json
 import sys
 
-from ajakscripts.gbugs import bgo
+from ajakscripts import gbugs, profiling
 
 
-def all_done(bug):
-    data = bgo.getbug(bug)
+def all_done(data):
     update = {}
 
     new_whiteboard = data.whiteboard.replace("glsa", "glsa+")
@@ -18,13 +19,53 @@ def all_done(bug):
         update["comment"] = {"body": "GLSA released, all done!"}
     update["whiteboard"] = new_whiteboard
 
-    print(f"[{data.id}]: {data.whiteboard} -> {new_whiteboard}" + (", closing" if close else ""))
-    bgo.update_bugs([data.id], update)
+    return update
+
+
+def group_updates(updates):
+    """
+    Group bug ids whose update payloads are identical so each group can go
+    out in a single update_bugs() call
+    """
+    groups = {}
+    for bug_id, update in updates.items():
+        key = json.dumps(update, sort_keys=True)
+        groups.setdefault(key, (update, []))[1].append(bug_id)
+    return list(groups.values())
+
+
+def print_table(bugs, updates):
+    width = max(len(bug.whiteboard) for bug in bugs)
+    for bug in bugs:
+        update = updates[bug.id]
+        close = ", closing" if "status" in update else ""
+        print(f"[{bug.id}]: {bug.whiteboard:<{width}} -> "
+              f"{update['whiteboard']}{close}")
 
 
 def main():
-    for bug in sys.argv[1:]:
-        all_done(bug)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--dry-run', action='store_true')
+    parser.add_argument('bugs', nargs='+')
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    profiling.setup(args)
+
+    # Fresh copies, the whiteboards we write are derived from these
+    bugs = gbugs.getbugs(args.bugs, fresh=True)
+    for bug, bug_str in zip(bugs, args.bugs):
+        if bug is None:
+            print(f"Bug {bug_str} doesn't seem to exist!")
+            sys.exit(1)
+
+    updates = {bug.id: all_done(bug) for bug in bugs}
+    print_table(bugs, updates)
+
+    if args.dry_run:
+        return
+
+    for update, ids in group_updates(updates):
+        gbugs.update_bugs(ids, update)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,66 @@
+import functools
+import os
+import xml.etree.ElementTree as ET
+
+from ajakscripts import cache, repos
+
+MAINTAINER_NEEDED = "maintainer-needed@gentoo.org"
+
+
+def iter_packages(repo_path):
+    """Yield (cp, package directory) for every package in an ebuild repo"""
+    repos.check_repo(repo_path)
+    with open(os.path.join(repo_path, 'profiles', 'categories')) as f:
+        categories = f.read().split()
+
+    for category in categories:
+        try:
+            entries = os.scandir(os.path.join(repo_path, category))
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir():
+                    yield f"{category}/{entry.name}", entry.path
+
+
+def iter_metadata(repo_path):
+    """Yield (cp, parsed metadata.xml root) for every package that has one"""
+    for cp, path in iter_packages(repo_path):
+        try:
+            yield cp, ET.parse(os.path.join(path, 'metadata.xml')).getroot()
+        except (OSError, ET.ParseError):
+            continue
+
+
+def _emails(root):
+    # Both people and projects (type="project") are listed as <maintainer>,
+    # in the order metadata.xml gives them, same as pkgcore. Only look at
+    # direct children, <upstream> has <maintainer>s of its own
+    return [maint.findtext('email').strip()
+            for maint in root.findall('maintainer')
+            if maint.findtext('email')]
+
+
+def build_index(repo_path) -> dict:
+    return {cp: _emails(root) for cp, root in iter_metadata(repo_path)}
+
+
+@functools.lru_cache(maxsize=None)
+def get_index(repo_path=None) -> dict:
+    """
+    Return a dict of cat/pkg -> maintainer emails, reusing the copy on disk
+    unless the repository moved on since it was built. repo_path defaults
+    to pkgcore's gentoo repo, as it does everywhere else.
+    """
+    repo_path = repo_path or repos.repo_path()
+    revision = cache.repo_revision(repo_path)
+    index = cache.load_index('maintainers.json', revision)
+    if index is None:
+        index = build_index(repo_path)
+        cache.save_index('maintainers.json', revision, index)
+    return index
+
+
+def maintainers(cp, repo_path=None) -> list:
+    return get_index(repo_path).get(cp) or [MAINTAINER_NEEDED]
@@ -0,0 +1,154 @@
+import functools
+import os
+import re
+
+from ajakscripts import profiling, repos
+
+# pkg-1.2.3_rc1-r1 -> pkg, 1.2.3_rc1-r1
+_PV_RE = re.compile(r'^(?P<pn>.+?)-(?P<pv>\d+(\.\d+)*[a-z]?'
+                    r'(_(alpha|beta|pre|rc|p)\d*)*(-r\d+)?)$')
+# 1.2.3b_rc1_p2-r1 -> 1.2.3, b, _rc1_p2, 1
+_VERSION_RE = re.compile(r'^(\d+(?:\.\d+)*)([a-z]?)'
+                         r'((?:_(?:alpha|beta|pre|rc|p)\d*)*)(?:-r(\d+))?$')
+_SUFFIX_RE = re.compile(r'_(alpha|beta|pre|rc|p)(\d*)')
+# In ascending order, 1.0_alpha < 1.0_rc < 1.0 < 1.0_p
+SUFFIXES = ('alpha', 'beta', 'pre', 'rc', 'p')
+
+
+def split_pv(name):
+    """Split "pkg-1.2-r1" into ("pkg", "1.2-r1"), or return None"""
+    match = _PV_RE.match(name)
+    if not match:
+        return None
+    return match.group('pn'), match.group('pv')
+
+
+def _parse_version(pv):
+    match = _VERSION_RE.match(pv)
+    if not match:
+        raise ValueError(f"invalid version {pv!r}")
+    numbers, letter, suffixes, revision = match.groups()
+    return (numbers.split('.'), letter,
+            [(SUFFIXES.index(name), int(number or 0))
+             for name, number in _SUFFIX_RE.findall(suffixes)],
+            int(revision or 0))
+
+
+def _cmp(a, b):
+    return (a > b) - (a < b)
+
+
+def vercmp(a, b) -> int:
+    """
+    Compare two versions (e.g. "1.02_rc1-r1") the way PMS says to,
+    returning -1, 0 or 1. Saves loading pkgcore for the plain version
+    ordering the md5-cache callers need.
+    """
+    numbers_a, letter_a, suffixes_a, revision_a = _parse_version(a)
+    numbers_b, letter_b, suffixes_b, revision_b = _parse_version(b)
+
+    if result := _cmp(int(numbers_a[0]), int(numbers_b[0])):
+        return result
+    for x, y in zip(numbers_a[1:], numbers_b[1:]):
+        # A leading zero makes it a decimal fraction, 1.02 < 1.1
+        if x.startswith('0') or y.startswith('0'):
+            result = _cmp(x.rstrip('0'), y.rstrip('0'))
+        else:
+            result = _cmp(int(x), int(y))
+        if result:
+            return result
+    if result := _cmp(len(numbers_a), len(numbers_b)):
+        return result
+
+    if result := _cmp(letter_a, letter_b):
+        return result
+
+    for x, y in zip(suffixes_a, suffixes_b):
+        if result := _cmp(x, y):
+            return result
+    # Only an extra _p makes a version newer, 1.0_rc1 < 1.0 < 1.0_p1
+    patch = SUFFIXES.index('p')
+    if len(suffixes_a) > len(suffixes_b):
+        return 1 if suffixes_a[len(suffixes_b)][0] == patch else -1
+    if len(suffixes_a) < len(suffixes_b):
+        return -1 if suffixes_b[len(suffixes_a)][0] == patch else 1
+
+    return _cmp(revision_a, revision_b)
+
+
+def md5_cache_dir(repo_path=None):
+    return os.path.join(repo_path or repos.repo_path(), 'metadata',
+                        'md5-cache')
+
+
+def has_md5_cache(repo_path=None):
+    try:
+        return os.path.isdir(md5_cache_dir(repo_path))
+    except repos.RepoError:
+        return False
+
+
+@profiling.timed('md5cache.read_entry')
+def read_entry(path, keys=None) -> dict:
+    """
+    Parse a single md5-cache entry, only keeping keys (e.g. ("KEYWORDS",
+    "SLOT")) if given
+    """
+    # Entries are a few hundred bytes, one read() is cheaper than mapping
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    prefixes = tuple(key.encode() + b'=' for key in keys) if keys else None
+    entry = {}
+    for line in data.splitlines():
+        if prefixes is None or line.startswith(prefixes):
+            key, _, value = line.partition(b'=')
+            entry[key.decode()] = value.decode()
+    return entry
+
+
+def iter_cpvs(repo_path=None, categories=None):
+    """Yield (cp, pv, path) for every ebuild in the md5-cache"""
+    repo_path = repo_path or repos.repo_path()
+    repos.check_repo(repo_path)
+    md5_cache = md5_cache_dir(repo_path)
+    if categories is None:
+        categories = sorted(os.listdir(md5_cache))
+
+    for category in categories:
+        try:
+            names = os.listdir(os.path.join(md5_cache, category))
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        for name in names:
+            split = split_pv(name)
+            if split is None:
+                continue
+            pn, pv = split
+            yield f"{category}/{pn}", pv, os.path.join(md5_cache, category, name)
+
+
+def iter_entries(repo_path=None, keys=None, categories=None):
+    """
+    Yield (cp, pv, entry) for every ebuild in the md5-cache, one at a time
+    so memory use doesn't grow with the size of the tree
+    """
+    for cp, pv, path in iter_cpvs(repo_path, categories):
+        yield cp, pv, read_entry(path, keys)
+
+
+def versions(cp, repo_path=None) -> list:
+    """Return the cpvs of every version of cp, oldest first"""
+    category, package = cp.split('/', 1)
+    try:
+        names = os.listdir(os.path.join(md5_cache_dir(repo_path), category))
+    except FileNotFoundError:
+        return []
+
+    pvs = []
+    for name in names:
+        split = split_pv(name)
+        if split and split[0] == package:
+            pvs.append(split[1])
+    pvs.sort(key=functools.cmp_to_key(vercmp))
+    return [f"{cp}-{pv}" for pv in pvs]
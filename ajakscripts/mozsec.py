@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
+import os
+import re
+import sys
+
+from bs4 import BeautifulSoup
+import requests
+
+from ajakscripts import cache, profiling
+
+ADVISORIES_URL = "https://www.mozilla.org/en-US/security/advisories/"
+
+# Mozilla product (as in "Fixed in") -> package we file bugs against
+PRODUCT_PACKAGES = {
+    "Firefox": "www-client/firefox",
+    "Firefox ESR": "www-client/firefox",
+    "Thunderbird": "mail-client/thunderbird",
+    "SeaMonkey": "www-client/seamonkey",
+}
+
+_MFSA_RE = re.compile(r'mfsa(\d{4})-(\d+)')
+_CVE_RE = re.compile(r'^CVE-\d{4}-\d+$')
+# "Firefox ESR 115.3" -> "Firefox ESR", "115.3"
+_FIXED_RE = re.compile(r'^(?P<product>.+?)\s+(?P<version>\d[\w.]*)$')
+
+
+def mfsa_key(mfsa):
+    year, num = _MFSA_RE.search(mfsa).groups()
+    return int(year), int(num)
+
+
+def parse_index(html) -> list:
+    """Return the advisory IDs linked from the advisories listing"""
+    soup = BeautifulSoup(html, "html.parser")
+    ids = {match.group(0) for link in soup.find_all('a', href=True)
+           for match in [_MFSA_RE.search(link['href'])] if match}
+    return sorted(ids, key=mfsa_key)
+
+
+def _summary(dl):
+    """Turn a <dl class="summary"> into a dict of dt -> dd"""
+    summary = {}
+    if dl is None:
+        return summary
+    for dt in dl.find_all('dt'):
+        dd = dt.find_next_sibling('dd')
+        if dd is None:
+            continue
+        items = [li.get_text(" ", strip=True) for li in dd.find_all('li')]
+        summary[dt.get_text(strip=True).lower()] = \
+            items or dd.get_text(" ", strip=True)
+    return summary
+
+
+@profiling.timed('mozsec.parse_advisory')
+def parse_advisory(mfsa, html) -> dict:
+    """
+    Parse an MFSA page into its announcement date, impact, fixed versions
+    and the CVEs it covers with their own title and impact
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    summary = _summary(soup.find('dl', class_='summary'))
+
+    fixed_in = summary.get('fixed in', [])
+    if isinstance(fixed_in, str):
+        fixed_in = [fixed_in]
+
+    fixed = []
+    for entry in fixed_in:
+        match = _FIXED_RE.match(entry)
+        if match:
+            fixed.append({"product": match.group('product'),
+                          "version": match.group('version')})
+
+    cves = []
+    for heading in soup.find_all(id=_CVE_RE):
+        title = heading.get_text(" ", strip=True)
+        # "# CVE-2023-1234: Use-after-free in ..." -> "Use-after-free in ..."
+        title = title.split(':', 1)[1].strip() if ':' in title else ''
+        level = heading.find_next('span', class_='level')
+        cves.append({
+            "id": heading['id'],
+            "title": title,
+            "impact": level.get_text(strip=True) if level else None,
+        })
+
+    return {
+        "id": mfsa,
+        "announced": summary.get('announced'),
+        "impact": summary.get('impact'),
+        "fixed": fixed,
+        "cves": cves,
+    }
+
+
+def load_cache() -> dict:
+    try:
+        with open(cache.cache_path('mozsec.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(advisories):
+    path = cache.cache_path('mozsec.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(advisories, f)
+    os.replace(path + '.tmp', path)
+
+
+@profiling.timed('mozsec.get_page')
+def get_page(session, pages, name):
+    """Get an advisory (or the "index") page, from disk if pages is set"""
+    if pages:
+        with open(os.path.join(pages, name + '.html')) as f:
+            return f.read()
+
+    url = ADVISORIES_URL if name == 'index' else f"{ADVISORIES_URL}{name}/"
+    response = session.get(url)
+    response.raise_for_status()
+    return response.text
+
+
+def _try_get_page(session, pages, mfsa):
+    try:
+        return get_page(session, pages, mfsa), None
+    except (requests.RequestException, OSError) as e:
+        return None, e
+
+
+def ingest(mfsas, pages=None, jobs=8):
+    """
+    Return (records, failed) for mfsas, only fetching and parsing the ones
+    we don't have cached yet. Advisories don't change once published.
+    failed maps the advisories we couldn't fetch or parse to why, the rest
+    are still returned and cached. An advisory without any CVEs counts as
+    failed, it's more likely a page we can't parse than an empty one.
+    """
+    advisories = load_cache()
+    # Older versions cached advisories without CVEs too, try those again
+    new = [mfsa for mfsa in mfsas
+           if not advisories.get(mfsa, {}).get('cves')]
+    failed = {}
+
+    if new:
+        session = requests.Session()
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            html = executor.map(
+                lambda mfsa: _try_get_page(session, pages, mfsa), new)
+            for mfsa, (page, error) in zip(new, html):
+                if error is None:
+                    try:
+                        advisory = parse_advisory(mfsa, page)
+                        if not advisory['cves']:
+                            raise ValueError("no CVEs found")
+                        advisories[mfsa] = advisory
+                    except (ValueError, AttributeError, TypeError) as e:
+                        error = e
+                if error is not None:
+                    failed[mfsa] = error
+        save_cache(advisories)
+
+    return ({mfsa: advisories[mfsa] for mfsa in mfsas if mfsa not in failed},
+            failed)
+
+
+def secbug_args(advisory) -> list:
+    """Turn an advisory into secbug-file arguments, one line per package"""
+    cves = " ".join(cve["id"] for cve in advisory["cves"])
+    packages = []
+    for fixed in advisory["fixed"]:
+        package = PRODUCT_PACKAGES.get(fixed["product"])
+        if package and package not in packages:
+            packages.append(package)
+    return [f"-p {package} -c {cves}" for package in packages if cves]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Turn Mozilla security advisories into secbug-file input")
+    parser.add_argument('-s', '--since', type=str,
+                        help="only advisories from this one on, e.g. "
+                             "mfsa2024-01")
+    parser.add_argument('-P', '--pages', type=str,
+                        help="read saved pages (index.html, mfsaYYYY-NN.html) "
+                             "from this directory instead of mozilla.org, "
+                             "e.g. fixtures/mozsec")
+    parser.add_argument('-j', '--jobs', type=int, default=8,
+                        help="advisory pages to fetch at once")
+    parser.add_argument('--json', action='store_true', default=False,
+                        help="print the parsed advisories as JSON")
+    parser.add_argument('advisories', nargs='*')
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    profiling.setup(args)
+
+    mfsas = args.advisories
+    if not mfsas:
+        mfsas = parse_index(get_page(requests.Session(), args.pages, 'index'))
+    if args.since:
+        mfsas = [mfsa for mfsa in mfsas
+                 if mfsa_key(mfsa) >= mfsa_key(args.since)]
+    if not mfsas:
+        print("No advisories")
+        sys.exit(1)
+
+    advisories, failed = ingest(sorted(set(mfsas), key=mfsa_key),
+                                pages=args.pages, jobs=args.jobs)
+
+    if args.json:
+        print(json.dumps(list(advisories.values()), indent=2))
+    else:
+        for mfsa, advisory in advisories.items():
+            for line in secbug_args(advisory):
+                print(line)
+
+    for mfsa, error in failed.items():
+        print(f"Skipped {mfsa}: {error}", file=sys.stderr)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
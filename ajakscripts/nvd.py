@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+
+from datetime import datetime, timedelta, timezone
+import argparse
+import json
+import os
+import sqlite3
+import sys
+
+from ajakscripts import cache, profiling, transport
+
+BASE_URL = "https://services.nvd.nist.gov/rest/json/cves/2.0"
+# The API refuses lastMod ranges longer than this
+MAX_WINDOW = timedelta(days=120)
+PAGE_SIZE = 2000
+# Requests per 30 seconds the NVD allows without and with an API key
+RATE_LIMIT = 5
+RATE_LIMIT_KEY = 50
+# Newest first, as long as a record has them
+CVSS_METRICS = ('cvssMetricV40', 'cvssMetricV31', 'cvssMetricV30',
+                'cvssMetricV2')
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%S.000+00:00"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cves (
+    id TEXT PRIMARY KEY,
+    last_modified TEXT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _cvss(metrics):
+    for key in CVSS_METRICS:
+        entries = metrics.get(key) or []
+        # The NVD's own ("Primary") score over a CNA's if there are both
+        entries = sorted(entries,
+                         key=lambda entry: entry.get('type') != 'Primary')
+        if entries:
+            data = entries[0]['cvssData']
+            return {
+                'version': data.get('version'),
+                'score': data.get('baseScore'),
+                # v2 keeps the severity next to cvssData instead of inside it
+                'severity': data.get('baseSeverity') or
+                            entries[0].get('baseSeverity'),
+                'vector': data.get('vectorString'),
+            }
+    return None
+
+
+def _cpe_range(match):
+    """A cpeMatch's CPE followed by its version bounds, like >=7.0 <8.5.0"""
+    bounds = [f"{op}{match[key]}" for key, op in (
+        ('versionStartIncluding', '>='), ('versionStartExcluding', '>'),
+        ('versionEndIncluding', '<='), ('versionEndExcluding', '<'))
+        if match.get(key)]
+    return ' '.join([match['criteria']] + bounds)
+
+
+def compact(cve) -> dict:
+    """Keep what we need of an NVD 2.0 CVE record: CVSS, vulnerable CPEs"""
+    cpes = []
+    for config in cve.get('configurations', []):
+        for node in config.get('nodes', []):
+            for match in node.get('cpeMatch', []):
+                if match.get('vulnerable'):
+                    cpe = _cpe_range(match)
+                    if cpe not in cpes:
+                        cpes.append(cpe)
+
+    return {
+        'id': cve['id'],
+        'status': cve.get('vulnStatus'),
+        'cvss': _cvss(cve.get('metrics', {})),
+        'cpes': cpes,
+    }
+
+
+class NvdStore:
+    """
+    Local copy of the NVD's CVSS and CPE data, one compact record per CVE
+
+    sync() fetches everything the first time and then only what changed
+    since the last sync, in lastModStartDate/lastModEndDate windows. Every
+    page is committed together with how far we got, so an interrupted sync
+    picks up from the page it stopped at.
+    """
+
+    def __init__(self, path=None):
+        self.db = sqlite3.connect(path or cache.cache_path("nvd.sqlite"))
+        self.db.executescript(SCHEMA)
+
+    def _get_meta(self, key):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?",
+                              (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self.db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                        (key, value))
+
+    def _store(self, vulnerabilities):
+        for vulnerability in vulnerabilities:
+            cve = vulnerability['cve']
+            self.db.execute("INSERT OR REPLACE INTO cves VALUES (?, ?, ?)",
+                            (cve['id'], cve.get('lastModified'),
+                             json.dumps(compact(cve))))
+
+    def _windows(self, now):
+        """The (start, end) windows still to fetch, None for everything"""
+        synced = self._get_meta('synced_until')
+        if synced is None:
+            return [(None, now)]
+
+        windows = []
+        start = datetime.fromisoformat(synced)
+        while start < now:
+            end = min(start + MAX_WINDOW, now)
+            windows.append((start, end))
+            start = end
+        return windows
+
+    def _fetch_window(self, session, base_url, start, end, index):
+        params = {'resultsPerPage': PAGE_SIZE}
+        if start is not None:
+            params['lastModStartDate'] = start.strftime(DATE_FORMAT)
+            params['lastModEndDate'] = end.strftime(DATE_FORMAT)
+
+        count = 0
+        while True:
+            response = session.get(base_url,
+                                   params=dict(params, startIndex=index))
+            response.raise_for_status()
+            page = response.json()
+            vulnerabilities = page.get('vulnerabilities', [])
+            index += len(vulnerabilities)
+            count += len(vulnerabilities)
+
+            with self.db:
+                self._store(vulnerabilities)
+                self._set_meta('resume', json.dumps({
+                    'start': start.isoformat() if start else None,
+                    'end': end.isoformat(),
+                    'index': index,
+                }))
+
+            if not vulnerabilities or index >= page.get('totalResults', 0):
+                return count
+
+    @profiling.timed('nvd.sync')
+    def sync(self, session, base_url=BASE_URL):
+        """Bring the store up to date, returning how many records came in"""
+        count = 0
+
+        resume = self._get_meta('resume')
+        if resume:
+            resume = json.loads(resume)
+            start = resume['start'] and datetime.fromisoformat(resume['start'])
+            end = datetime.fromisoformat(resume['end'])
+            print(f"Resuming at {resume['index']}", file=sys.stderr)
+            count += self._fetch_window(session, base_url, start, end,
+                                        resume['index'])
+            self._finish_window(end)
+
+        for start, end in self._windows(datetime.now(timezone.utc)):
+            count += self._fetch_window(session, base_url, start, end, 0)
+            self._finish_window(end)
+
+        return count
+
+    def _finish_window(self, end):
+        with self.db:
+            self._set_meta('synced_until', end.isoformat())
+            self.db.execute("DELETE FROM meta WHERE key = 'resume'")
+
+    def lookup(self, cves):
+        """Return a dict of CVE ID -> compact record for the CVEs we have"""
+        cves = list(cves)
+        found = {}
+        for i in range(0, len(cves), 500):
+            chunk = cves[i:i + 500]
+            placeholders = ','.join('?' * len(chunk))
+            for (data,) in self.db.execute("SELECT data FROM cves WHERE id IN "
+                                           f"({placeholders})", chunk):
+                record = json.loads(data)
+                found[record['id']] = record
+        return found
+
+
+def get_session(api_key=None):
+    # A full first sync is well over a hundred pages, stay under the limit
+    # instead of finding out about it
+    rate = RATE_LIMIT_KEY if api_key else RATE_LIMIT
+    # The NVD answers 403 rather than 429 once we go over it anyway
+    session = transport.Session(rate=rate / 30, burst=rate, max_per_host=1,
+                                throttled=(transport.THROTTLED, 403))
+    if api_key:
+        session.headers['apiKey'] = api_key
+    return profiling.wrap(session, ['request'], 'http')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Keep a local copy of NVD CVSS scores and CPEs")
+    parser.add_argument('--base-url', type=str, default=BASE_URL,
+                        help="NVD CVE API 2.0 to talk to, e.g. a local "
+                             "fixture server")
+    parser.add_argument('-l', '--lookup', action='store_true', default=False,
+                        help="print what we have for cves instead of syncing")
+    parser.add_argument('cves', nargs='*')
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    profiling.setup(args)
+
+    store = NvdStore()
+    if args.lookup:
+        found = store.lookup(args.cves)
+        print(json.dumps([found.get(cve) for cve in args.cves], indent=2))
+        return
+
+    # NVD_API_KEY raises the rate limit tenfold
+    session = get_session(os.environ.get('NVD_API_KEY'))
+    count = store.sync(session, args.base_url.rstrip('/'))
+    print(f"Updated {count} records")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+
+from collections import Counter
+from urllib.parse import urlsplit
+import argparse
+import functools
+import json
+import re
+import sys
+
+from ajakscripts import cache, maintindex, md5cache, profiling, repos
+from ajakscripts.cveindex import CVELIST_DIR, CveIndex
+
+# How much a hit on each kind of key is worth. A CPE remote-id in
+# metadata.xml is as good as it gets, an upstream account name (the
+# "curl" in github "curl/curl") says the least.
+WEIGHTS = {
+    'cpe': 1.0,
+    'name': 0.9,
+    'remote-id': 0.8,
+    'homepage': 0.6,
+    'vendor': 0.3,
+}
+# Bumped whenever build_index() changes what it stores, so that copies
+# built by older versions are rebuilt
+INDEX_VERSION = 2
+# Fuzzy hits below this trigram similarity are ignored
+MIN_SIMILARITY = 0.6
+# Fuzzy hits are worth this much less than exact ones of the same kind
+FUZZY_PENALTY = 0.8
+
+# Hosts whose path names the project as owner/repo, not the host
+CODE_HOSTS = {'github.com', 'gitlab.com', 'codeberg.org', 'bitbucket.org',
+              'sr.ht', 'git.sr.ht', 'gitlab.gnome.org', 'invent.kde.org'}
+# Hosts with one page per project under a fixed path component, as in
+# pypi.org/project/<name>
+REGISTRIES = {'sourceforge.net': 'projects', 'pypi.org': 'project',
+              'crates.io': 'crates', 'metacpan.org': 'release',
+              'rubygems.org': 'gems', 'www.npmjs.com': 'package',
+              'hackage.haskell.org': 'package'}
+# Subdomains of these are projects, as in curl.github.io
+PROJECT_DOMAINS = ('.github.io', '.gitlab.io', '.sourceforge.net',
+                   '.sourceforge.io', '.readthedocs.io', '.codeberg.page')
+# Too generic to say anything about which package is meant
+STOPWORDS = {'the', 'project', 'inc', 'ltd', 'llc', 'corp', 'corporation',
+             'software', 'foundation', 'community', 'org', 'com', 'www',
+             'open', 'source', 'linux', 'server', 'client', 'library',
+             'plugin', 'unspecified', 'unknown'}
+
+_SPLIT_RE = re.compile(r'[^a-z0-9]+')
+
+
+def normalize(name):
+    """Lowercase and drop punctuation, the form every key is stored in"""
+    return _SPLIT_RE.sub('', name.lower())
+
+
+def trigrams(key):
+    padded = f" {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def homepage_keys(url):
+    """Return (source, key) pairs for the names a HOMEPAGE URL gives"""
+    parts = urlsplit(url)
+    host = parts.hostname or ''
+    path = [segment for segment in parts.path.split('/') if segment]
+
+    if host in CODE_HOSTS:
+        # The owner is an account that may well own other projects
+        return [('vendor', owner) for owner in path[:1]] + \
+            [('homepage', repo) for repo in path[1:2]]
+
+    if host in REGISTRIES:
+        if len(path) >= 2 and path[0] == REGISTRIES[host]:
+            return [('homepage', path[1])]
+        return []
+
+    for suffix in PROJECT_DOMAINS:
+        if host.endswith(suffix):
+            return [('homepage', host[:-len(suffix)].split('.')[-1])]
+
+    # www.openssl.org -> openssl, the label left of the public suffix
+    labels = [label for label in host.split('.') if label != 'www']
+    if len(labels) >= 3 and len(labels[-1]) == 2 and len(labels[-2]) <= 3:
+        return [('homepage', labels[-3])]  # example.co.uk
+    return [('homepage', label) for label in labels[-2:-1]]
+
+
+def remote_id_keys(kind, value):
+    """Return (source, key) pairs for a metadata.xml <remote-id>"""
+    if kind == 'cpe':
+        # cpe:/a:vendor:product or cpe:2.3:a:vendor:product:...
+        fields = value.split(':') + ['']
+        fields = fields[2:] if fields[1].startswith('/') else fields[3:]
+        if len(fields) >= 2 and fields[0] and fields[1]:
+            return [('cpe', f"{normalize(fields[0])}:{normalize(fields[1])}"),
+                    ('remote-id', normalize(fields[1]))]
+        return []
+
+    segments = value.strip('/').split('/')
+    keys = [('remote-id', normalize(segments[-1]))]
+    if len(segments) > 1:
+        keys.append(('vendor', normalize(segments[0])))
+    return keys
+
+
+def build_index(repo_path) -> dict:
+    """Build a dict of normalized key -> [[cat/pkg, source], ...]"""
+    index = {}
+
+    def add(key, cp, source):
+        if len(key) < 2 or key in STOPWORDS:
+            return
+        entries = index.setdefault(key, [])
+        if [cp, source] not in entries:
+            entries.append([cp, source])
+
+    for cp, root in maintindex.iter_metadata(repo_path):
+        for remote in root.findall('upstream/remote-id'):
+            if remote.text:
+                for source, key in remote_id_keys(remote.get('type', ''),
+                                                  remote.text.strip()):
+                    add(key, cp, source)
+
+    for cp, _, entry in md5cache.iter_entries(repo_path, keys=('HOMEPAGE',)):
+        add(normalize(cp.split('/')[1]), cp, 'name')
+        for url in entry.get('HOMEPAGE', '').split():
+            for source, key in homepage_keys(url):
+                add(normalize(key), cp, source)
+
+    return index
+
+
+class Matcher:
+    """
+    Ranks packages for vendor/product names. Exact hits are a dict lookup,
+    anything else goes through a trigram index over every key, built once
+    when the matcher is created.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.trigrams = {}
+        for key in index:
+            for gram in trigrams(key):
+                self.trigrams.setdefault(gram, []).append(key)
+
+    def similar(self, term):
+        """Yield (key, similarity) for keys sharing enough trigrams"""
+        grams = trigrams(term)
+        shared = Counter(key for gram in grams
+                         for key in self.trigrams.get(gram, ()))
+        for key, count in shared.items():
+            # Dice coefficient, a padded key of n characters has n trigrams
+            similarity = 2 * count / (len(grams) + len(key))
+            if similarity >= MIN_SIMILARITY:
+                yield key, similarity
+
+    def _hits(self, term, scores):
+        if term in self.index:
+            hits = [(term, 1.0)]
+        elif len(term) >= 4:
+            hits = [(key, similarity * FUZZY_PENALTY)
+                    for key, similarity in self.similar(term)]
+        else:
+            hits = []
+
+        for key, similarity in hits:
+            for cp, source in self.index[key]:
+                scores.setdefault(cp, []).append(WEIGHTS[source] * similarity)
+
+    @profiling.timed('pkgmatch.match')
+    def match(self, products, limit=5) -> list:
+        """
+        Return up to limit (cat/pkg, score) pairs for (vendor, product)
+        pairs, best first
+        """
+        scores = {}
+        for vendor, product in products:
+            vendor, product = normalize(vendor), normalize(product)
+            cpe = f"{vendor}:{product}"
+            if cpe in self.index:
+                for cp, _ in self.index[cpe]:
+                    scores.setdefault(cp, []).append(WEIGHTS['cpe'])
+
+            self._hits(product, scores)
+            # Half the time libcurl means curl
+            if product.startswith('lib') and len(product) > 6:
+                self._hits(product[3:], scores)
+            # Vendor "Apache", product "Tomcat" is packaged as apache-tomcat
+            if vendor and vendor != product:
+                self._hits(vendor + product, scores)
+                for cp in [cp for cp, _ in self.index.get(vendor, [])
+                           if cp in scores]:
+                    scores[cp].append(WEIGHTS['vendor'])
+
+        # The best hit decides, a few more only nudge it up
+        ranked = [(cp, round(max(hits) + 0.05 * min(len(hits) - 1, 4), 3))
+                  for cp, hits in scores.items()]
+        ranked.sort(key=lambda item: (-item[1], item[0]))
+        return ranked[:limit]
+
+
+@functools.lru_cache(maxsize=None)
+def get_matcher(repo_path=None) -> Matcher:
+    repo_path = repo_path or repos.repo_path()
+    revision = cache.repo_revision(repo_path)
+    if revision is not None:
+        revision += f"+v{INDEX_VERSION}"
+    index = cache.load_index('pkgmatch.json', revision)
+    if index is None:
+        index = build_index(repo_path)
+        cache.save_index('pkgmatch.json', revision, index)
+    return Matcher(index)
+
+
+def parse_product(string):
+    """Split vendor:product, or a bare product, into (vendor, product)"""
+    vendor, _, product = string.rpartition(':')
+    return vendor, product
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Suggest the packages CVEs or upstream products are about")
+    parser.add_argument('-r', '--repo', type=str,
+                        help="defaults to pkgcore's gentoo repo")
+    parser.add_argument('-d', '--cvelist', type=str, default=CVELIST_DIR)
+    parser.add_argument('-P', '--product', action='append', default=[],
+                        help="match vendor:product (or just product) instead "
+                             "of CVEs, may be repeated")
+    parser.add_argument('-n', '--limit', type=int, default=5)
+    parser.add_argument('-m', '--manifest', action='store_true', default=False,
+                        help="print the best match for each CVE as "
+                             "secbug-file --manifest lines")
+    parser.add_argument('-j', '--json', action='store_true', default=False)
+    parser.add_argument('cves', nargs='*')
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    profiling.setup(args)
+
+    if args.manifest and args.product:
+        parser.error("--manifest maps CVEs, it can't be used with --product")
+
+    if args.product:
+        queries = {"products": [parse_product(product)
+                                for product in args.product]}
+    elif args.cves:
+        index = CveIndex(args.cvelist)
+        found = index.lookup(args.cves)
+        if len(found) < len(set(args.cves)):
+            index.update()
+            found = index.lookup(args.cves)
+        missing = [cve for cve in args.cves if cve not in found]
+        if missing:
+            print("Unknown CVEs: {}".format(" ".join(missing)),
+                  file=sys.stderr)
+        queries = {cve: found[cve]['products'] for cve in args.cves
+                   if cve in found}
+    else:
+        parser.error("give some CVEs or --product")
+
+    matcher = get_matcher(args.repo)
+    results = {name: matcher.match(products, args.limit)
+               for name, products in queries.items()}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    elif args.manifest:
+        # One bug per package, with all of the CVEs mapped to it
+        by_package = {}
+        for cve, candidates in results.items():
+            if candidates:
+                by_package.setdefault(candidates[0][0], []).append(cve)
+            else:
+                print(f"# no match: {cve}")
+        for cp, cves in by_package.items():
+            print(f"-p {cp} -c {' '.join(cves)}")
+    else:
+        for name, candidates in results.items():
+            print("{}: {}".format(name, ", ".join(
+                f"{cp} ({score})" for cp, score in candidates) or "no match"))
+
+
+if __name__ == "__main__":
+    main()
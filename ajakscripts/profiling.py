@@ -0,0 +1,122 @@
+from contextlib import contextmanager
+import atexit
+import cProfile
+import functools
+import json
+import sys
+import threading
+import time
+
+# Spans are only recorded with --profile, some (md5cache.read_entry) happen
+# once per ebuild in the tree and would otherwise pile up for nothing
+_enabled = False
+_spans = {}
+_lock = threading.Lock()
+# Run by finish(), at exit or when the daemon is done with a command
+_finish_hooks = []
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def record(name, duration):
+    if not _enabled:
+        return
+    with _lock:
+        _spans.setdefault(name, []).append(duration)
+
+
+@contextmanager
+def span(name):
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def timed(name):
+    """Decorator recording every call of the function as a span"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # Skip even the context manager when nobody's looking
+            if not _enabled:
+                return func(*args, **kwargs)
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def wrap(obj, methods, prefix):
+    """Record calls to methods of obj as "<prefix>.<method>" spans"""
+    for method in methods:
+        setattr(obj, method,
+                timed(f"{prefix}.{method}")(getattr(obj, method)))
+    return obj
+
+
+def _percentile(durations, fraction):
+    return durations[int(fraction * (len(durations) - 1))]
+
+
+def summary() -> dict:
+    with _lock:
+        spans = {name: sorted(durations) for name, durations in _spans.items()}
+    return {name: {
+        'count': len(durations),
+        'total': sum(durations),
+        'p50': _percentile(durations, 0.5),
+        'p95': _percentile(durations, 0.95),
+    } for name, durations in sorted(spans.items())}
+
+
+def reset():
+    """Drop the recorded spans and stop recording until setup() says so"""
+    global _enabled
+    with _lock:
+        _spans.clear()
+        _enabled = False
+
+
+def at_finish(func):
+    if not _finish_hooks:
+        atexit.register(finish)
+    _finish_hooks.append(func)
+
+
+def finish():
+    while _finish_hooks:
+        _finish_hooks.pop(0)()
+
+
+def add_arguments(parser):
+    parser.add_argument('--profile', action='store_true', default=False,
+                        help="print a JSON summary of where time went to "
+                             "stderr on exit")
+    parser.add_argument('--profile-dump', type=str, metavar='FILE',
+                        help="also write cProfile stats to FILE")
+
+
+def setup(args):
+    """Act on the add_arguments() options, call right after parse_args()"""
+    if args.profile_dump:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+        def dump():
+            profiler.disable()
+            profiler.dump_stats(args.profile_dump)
+        at_finish(dump)
+
+    if args.profile:
+        enable()
+        # Look sys.stderr up late, the daemon swaps it for every command
+        at_finish(lambda: print(json.dumps(summary(), indent=2),
+                                file=sys.stderr))
@@ -0,0 +1,60 @@
+import functools
+import re
+
+from pkgcore.ebuild.cpv import VersionedCPV
+
+from ajakscripts import cache, md5cache, repos
+
+_USE_RE = re.compile(r'\bpython_(?:targets|single_target)_(\w+)')
+# python-any-r1 packages have no target flags, only dependencies on the
+# interpreters in PYTHON_COMPAT
+_DEP_RE = re.compile(r'\bdev-lang/(python|pypy):(\d+)\.(\d+)')
+_WANTED_KEYS = ('IUSE', 'BDEPEND', 'DEPEND', 'PROPERTIES')
+
+
+def _impl_from_dep(match):
+    name, major, minor = match.groups()
+    if name == 'pypy':
+        return f'pypy{major}_{minor}'
+    return f'python{major}_{minor}'
+
+
+def _impls(entry) -> list:
+    impls = set(_USE_RE.findall(entry.get('IUSE', '')))
+    if not impls:
+        deps = entry.get('BDEPEND', '') + ' ' + entry.get('DEPEND', '')
+        impls = {_impl_from_dep(match) for match in _DEP_RE.finditer(deps)}
+    return sorted(impls)
+
+
+def build_index(repo_path) -> dict:
+    """
+    Build a dict of cat/pkg -> [[version, [impls], live], ...] in a single
+    pass over metadata/md5-cache
+    """
+    index = {}
+    for cp, pv, entry in md5cache.iter_entries(repo_path, keys=_WANTED_KEYS):
+        live = 'live' in entry.get('PROPERTIES', '').split()
+        index.setdefault(cp, []).append([pv, _impls(entry), live])
+    return index
+
+
+@functools.lru_cache(maxsize=None)
+def get_index(repo_path=None) -> dict:
+    repo_path = repo_path or repos.repo_path()
+    revision = cache.repo_revision(repo_path)
+    index = cache.load_index('pycompat.json', revision)
+    if index is None:
+        index = build_index(repo_path)
+        cache.save_index('pycompat.json', revision, index)
+    return index
+
+
+def versions_supporting(cp, impl, repo_path=None, live=False) -> list:
+    """
+    Return the cpvs of cp that support impl (e.g. python3_11), oldest
+    first, leaving out live ebuilds unless asked for
+    """
+    cpvs = [f"{cp}-{pv}" for pv, impls, is_live in get_index(repo_path).get(cp, [])
+            if impl in impls and (live or not is_live)]
+    return sorted(cpvs, key=VersionedCPV)
@@ -0,0 +1,81 @@
+import configparser
+import functools
+import os
+
+from ajakscripts import profiling
+
+# Loading the pkgcore config and instantiating a repo is expensive, so it's
+# done at most once per process and everything here is memoized. pkgcore
+# itself is only imported once something here is called, plenty of our
+# importers never need it.
+
+
+# Read in this order, later files override earlier ones, as portage does
+REPOS_CONF = ('/usr/share/portage/config/repos.conf',
+              '/etc/portage/repos.conf')
+
+
+class RepoError(Exception):
+    pass
+
+
+@functools.lru_cache(maxsize=None)
+@profiling.timed('pkgcore.load_config')
+def get_config():
+    import pkgcore.config
+    return pkgcore.config.load_config()
+
+
+@functools.lru_cache(maxsize=None)
+@profiling.timed('pkgcore.get_repo')
+def get_repo(name='gentoo'):
+    return get_config().objects.repo[name]
+
+
+def _repos_conf() -> configparser.ConfigParser:
+    """Parse repos.conf, either file or directory of files, from REPOS_CONF"""
+    parser = configparser.ConfigParser(interpolation=None, strict=False)
+    for path in REPOS_CONF:
+        if os.path.isdir(path):
+            parser.read(sorted(os.path.join(path, name)
+                               for name in os.listdir(path)
+                               if not name.startswith('.')))
+        else:
+            parser.read(path)
+    return parser
+
+
+@functools.lru_cache(maxsize=None)
+def repo_path(name='gentoo'):
+    """
+    Return where the repo lives, from the repos.conf pkgcore is configured
+    by too. Every index we build from a tree comes from this one, so that
+    it agrees with what atoms are matched against. Reading repos.conf
+    ourselves keeps pkgcore out of processes that only read the tree.
+    """
+    try:
+        path = _repos_conf()[name]['location']
+    except KeyError:
+        raise RepoError(f"repos.conf has no location for a repository "
+                        f"named {name!r}") from None
+    check_repo(path)
+    return path
+
+
+def check_repo(path):
+    """Raise RepoError unless path looks like an ebuild repository"""
+    if not os.path.isfile(os.path.join(path, 'profiles', 'categories')):
+        raise RepoError(f"{path} is not an ebuild repository "
+                        "(no profiles/categories), is it synced?")
+
+
+@functools.lru_cache(maxsize=None)
+@profiling.timed('pkgcore.match')
+def match(atom_str, repo='gentoo') -> tuple:
+    from pkgcore.ebuild import atom as atom_mod
+    return tuple(get_repo(repo).match(atom_mod.atom(atom_str)))
+
+
+def resolve_many(atoms, repo='gentoo') -> dict:
+    """Match every atom string in atoms, returning a dict of atom -> matches"""
+    return {atom_str: match(atom_str, repo) for atom_str in atoms}
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+import argparse
+import fnmatch
+import functools
+import os
+
+from ajakscripts import cache, md5cache, profiling, repos
+
+DEP_KEYS = ('DEPEND', 'RDEPEND', 'BDEPEND', 'PDEPEND', 'IDEPEND')
+
+
+def atom_cp(token):
+    """
+    Return the cat/pkg of a dependency atom like ">=dev-libs/foo-1.2:0=[bar]",
+    or None for anything that isn't one
+    """
+    stripped = token.lstrip('<>=~')
+    versioned = stripped != token
+    cp = stripped.split('[', 1)[0].split(':', 1)[0].rstrip('*')
+    if '/' not in cp:
+        return None
+
+    if versioned:
+        category, pv = cp.split('/', 1)
+        split = md5cache.split_pv(pv)
+        if split is None:
+            return None
+        cp = f"{category}/{split[0]}"
+    return cp
+
+
+def dep_cps(depstr):
+    """Yield the cat/pkg of every non-blocker atom in a dependency string"""
+    for token in depstr.split():
+        # Skip ||, parentheses, USE conditionals and blockers
+        if token in ('||', '(', ')') or token.endswith('?') or \
+                token.startswith('!'):
+            continue
+        cp = atom_cp(token)
+        if cp:
+            yield cp
+
+
+def build_index(repo_path) -> dict:
+    """Build a dict of cat/pkg -> sorted cat/pkgs depending on it"""
+    rdeps = {}
+    for cp, _, entry in md5cache.iter_entries(repo_path, keys=DEP_KEYS):
+        rdeps.setdefault(cp, set())
+        for key in DEP_KEYS:
+            for dep in dep_cps(entry.get(key, '')):
+                if dep != cp:
+                    rdeps.setdefault(dep, set()).add(cp)
+    return {cp: sorted(users) for cp, users in rdeps.items()}
+
+
+@functools.lru_cache(maxsize=None)
+def get_index(repo_path=None) -> dict:
+    repo_path = repo_path or repos.repo_path()
+    revision = cache.repo_revision(repo_path)
+    index = cache.load_index('revdeps.json', revision)
+    if index is None:
+        index = build_index(repo_path)
+        cache.save_index('revdeps.json', revision, index)
+    return index
+
+
+def masked_packages(repo_path) -> set:
+    """cat/pkgs masked as a whole in profiles/package.mask"""
+    masked = set()
+    try:
+        with open(os.path.join(repo_path, 'profiles', 'package.mask')) as f:
+            for line in f:
+                line = line.strip()
+                # Version-specific masks don't take the whole package out
+                if line and not line.startswith('#') and \
+                        line == atom_cp(line):
+                    masked.add(line)
+    except FileNotFoundError:
+        pass
+    return masked
+
+
+def matches(cp, patterns):
+    category = cp.split('/')[0]
+    for pattern in patterns:
+        target = cp if '/' in pattern else category
+        if fnmatch.fnmatchcase(target, pattern):
+            return True
+    return False
+
+
+def find_revdepless(index, patterns, ignore=frozenset(), orphans=False):
+    """
+    Return the packages matching patterns that nothing depends on, not
+    counting reverse dependencies from packages in ignore. With orphans,
+    reverse dependencies that only come from other such packages in the
+    selection don't count either.
+    """
+    selected = [cp for cp in index if matches(cp, patterns)]
+    ignore = set(ignore)
+    found = set()
+
+    while True:
+        new = {cp for cp in selected if cp not in found and
+               not set(index[cp]) - ignore - found}
+        if not new:
+            break
+        found |= new
+        if not orphans:
+            break
+
+    return sorted(found)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="List packages that nothing in the tree depends on")
+    parser.add_argument('-r', '--repo', type=str,
+                        help="defaults to pkgcore's gentoo repo")
+    parser.add_argument('-o', '--ignore-orphans', action='store_true',
+                        default=False,
+                        help="don't count reverse deps from other packages "
+                             "this would list")
+    parser.add_argument('-m', '--ignore-masked', action='store_true',
+                        default=False,
+                        help="don't count reverse deps from masked packages")
+    parser.add_argument('patterns', nargs='*', default=['virtual'],
+                        help="categories or cat/pkg globs, e.g. virtual, "
+                             "'acct-*' or 'dev-python/*'")
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    profiling.setup(args)
+
+    repo_path = args.repo or repos.repo_path()
+    index = get_index(repo_path)
+    ignore = masked_packages(repo_path) if args.ignore_masked else set()
+
+    for cp in find_revdepless(index, args.patterns, ignore,
+                              args.ignore_orphans):
+        print(cp)
+
+
+if __name__ == "__main__":
+    main()
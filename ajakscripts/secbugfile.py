@@ -1,61 +1,49 @@
 #!/usr/bin/env python
 
-from configparser import ConfigParser
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 import argparse
-import json
 import os
+import re
+import shlex
 import subprocess
 import sys
 
-from bugzilla import Bugzilla
-from pkgcore.ebuild import atom as atom_mod
-import pkgcore.config
 import requests
 
-
-def get_api_key():
-    bugzrc = os.path.expanduser("~/.bugzrc")
-    config = ConfigParser()
-    config.read(bugzrc)
-    apikey = config['default']['key']
-    return apikey
-
-
-BZ_BUG_API = "https://bugs.gentoo.org/rest/bug"
-bgo = Bugzilla('https://bugs.gentoo.org', api_key=get_api_key(), force_rest=True)
-
-
-def atom_maints(atom) -> list:
-    # Get list of strings per maintainer object
-    strings = [str(maint) for maint in atom.maintainers]
-
-    # Slice off the name, get the <email>
-    mails = [maint.split(" ")[-1] for maint in strings]
-
-    # Return list of plain emails
-    mails = [mail.replace("<", "").replace(">", "") for mail in mails]
-
-    if len(mails) > 0:
-        return mails
-    return ["maintainer-needed@gentoo.org"]
-
-
-def cp_atom(atom_str):
-    repo = pkgcore.config.load_config().objects.repo['gentoo']
-    atom = atom_mod.atom(atom_str)
-    return repo.match(atom)
-
-
-def file_bug(params):
-    params["Bugzilla_api_key"] = get_api_key()
-    params["version"] = "unspecified"
-
-    return requests.post(BZ_BUG_API, data=params)
+from ajakscripts import client, gbugs, maintindex, md5cache, profiling
+from ajakscripts.cveindex import CveIndex
+from ajakscripts.gbugs import BZ_BUG_API
+from ajakscripts.nvd import NvdStore
+
+DRAFT_SEPARATOR = "%%%% secbug-file draft: "
+_CP_RE = re.compile(r'^[A-Za-z0-9][\w+.-]*/[A-Za-z0-9_][\w+-]*$')
+# NVD severity -> the Bugzilla severity it roughly corresponds to
+NVD_SEVERITIES = {
+    "CRITICAL": "critical",
+    "HIGH": "major",
+    "MEDIUM": "normal",
+    "LOW": "minor",
+}
+# More than this many CPEs per CVE is noise in a draft
+MAX_CPE_HINTS = 5
+
+
+def package_key(package):
+    """
+    Return the cat/pkg of package, or None if it doesn't exist. Plain
+    cat/pkg names are checked against the md5-cache, anything fancier needs
+    pkgcore.
+    """
+    if _CP_RE.match(package) and md5cache.has_md5_cache():
+        return package if md5cache.versions(package) else None
+
+    atoms = gbugs.cp_atom(package)
+    return atoms[0].key if atoms else None
 
 
 def urldata(url):
-    response = requests.get(url)
+    response = gbugs.get_session().get(url)
     if response.status_code != 200:
         print('{} status code for URL: {}'.format(response.status_code, url))
         print(response.content)
@@ -64,26 +52,44 @@ def urldata(url):
 
 
 def get_bug(bug):
-    response = requests.get(BZ_BUG_API + 'rest/bug/' + str(bug))
-
-
-def get_ref_urls(data):
-    refs = data['references']['reference_data']
-    return [ref['url'] for ref in refs]
+    response = gbugs.get_session().get(BZ_BUG_API + 'rest/bug/' + str(bug))
+
+
+def nvd_hints(record):
+    """# lines with what the NVD has on a CVE, parse_bugdata() drops them"""
+    if not record:
+        return []
+    hints = []
+    cvss = record['cvss']
+    if cvss:
+        hints.append("# NVD CVSS {}: {} {} {}".format(
+            cvss['version'], cvss['score'], cvss['severity'], cvss['vector']))
+    for cpe in record['cpes'][:MAX_CPE_HINTS]:
+        hints.append("# CPE: {}".format(cpe))
+    if len(record['cpes']) > MAX_CPE_HINTS:
+        hints.append("# ... and {} more CPEs".format(
+            len(record['cpes']) - MAX_CPE_HINTS))
+    return hints
+
+
+def severity_hint(cve_data):
+    """A # line suggesting a severity from the worst NVD score, if any"""
+    scores = [data['nvd']['cvss'] for data in cve_data or []
+              if data.get('nvd') and data['nvd']['cvss']]
+    if not scores:
+        return None
+    worst = max(scores, key=lambda cvss: cvss['score'] or 0)
+    return "# Worst NVD score: {} {}, suggests severity {}".format(
+        worst['score'], worst['severity'],
+        NVD_SEVERITIES.get(worst['severity'], "normal"))
 
 
 def generate_description(cve_list):
     desc = []
     for data in cve_list:
-        cve_id = data['CVE_data_meta']['ID']
-        # So this description_data chunk of the JSON is something like:
-        # {'description_data': [{'lang': 'en', 'value': 'FFmpeg 4.2 is affected by a Divide By Zero issue via libavcodec/aaccoder, which allows a remote malicious user to cause a Denial of Service'}]}
-        # We use a magic '0' to index this array, but is it ever
-        # bigger than one?
-        cve_desc = data['description']['description_data'][0]['value']
-        if len(data['description']['description_data']) > 1:
-            print(cve_id + "\'s description array is bigger than one, take a look!")
-        cve_refs = get_ref_urls(data)
+        cve_id = data['id']
+        cve_desc = data['description']
+        cve_refs = data['references']
 
         if len(cve_refs) > 0:
             desc.append("{} ({}):".format(cve_id, cve_refs[0]))
@@ -92,12 +98,14 @@ def generate_description(cve_list):
                     desc.append("# {}".format(ref))
         else:
             desc.append("{}:".format(cve_id))
+        desc += nvd_hints(data.get('nvd'))
         desc.append("")
         desc.append(cve_desc)
         desc.append("")
     return '\n'.join(desc)
 
 
+@profiling.timed('editor')
 def write_edit_read(editor, string):
     path = "/tmp/secbug-file.txt"
     with open(path, "w") as f:
@@ -116,7 +124,8 @@ def get_editor():
         return ['nano']
 
 
-def edit_data(package, cves, cc, cve_data=None, bug_data=None):
+def format_data(package, cves, cc, cve_data=None, bug_data=None,
+                whiteboard=None):
     string = []
 
     if bug_data:
@@ -133,7 +142,10 @@ def edit_data(package, cves, cc, cve_data=None, bug_data=None):
         string.append("Whiteboard: " + bug_data.whiteboard)
         string.append("URL: " + bug_data.url)
     else:
-        string.append("Whiteboard: ")
+        string.append("Whiteboard: " + (whiteboard or ""))
+        hint = severity_hint(cve_data)
+        if hint and not whiteboard:
+            string.append(hint)
         string.append("URL: ")
 
     if cve_data:
@@ -141,29 +153,64 @@ def edit_data(package, cves, cc, cve_data=None, bug_data=None):
     else:
         string.append("Description: ")
 
-    return write_edit_read(get_editor(), '\n'.join(string))
+    return '\n'.join(string)
+
 
+def prepare_draft(options) -> str:
+    """
+    Return the draft to edit for a single run, options being its command
+    line options as a dict. Runs in ajakscripts-daemon if there is one.
+    """
+    bug_data = None
+    alias = []
+    if options['bug']:
+        # Fresh, the CCs and aliases end up in the update
+        bug_data = gbugs.getbug(options['bug'], fresh=True)
+        cc = bug_data.cc
+        alias = bug_data.alias
+    else:
+        cp = package_key(options['package'])
+        if cp is None:
+            print("Package {} doesn't seem to exist!".format(
+                options['package']))
+            sys.exit(1)
+
+        cc = maintindex.maintainers(cp)
+
+    cves = options['cves']
+    if cves:
+        alias = sorted(list(set(cves + alias)))
 
+    if options['nofetch']:
+        return format_data(options['package'], alias, cc,
+                           whiteboard=options['whiteboard'])
+
+    cve_data = get_cve_data(cves) if cves else None
+    return format_data(options['package'], alias, cc, cve_data=cve_data,
+                       bug_data=bug_data, whiteboard=options['whiteboard'])
+
+
+@profiling.timed('cve_data')
 def get_cve_data(cves):
-    cve_data = []
-    base_url = 'https://services.nvd.nist.gov/rest/json/cve/1.0/'
-    for cve in cves:
-        year = cve.split('-')[1]
-        num = cve.split('-')[2]
+    index = CveIndex()
+    found = index.lookup(cves)
 
-        if len(num) == 4:
-            dirname = f"{num[0]}xxx"
-        elif len(num) == 7:
-            dirname = f"{num[:4]}xxx"
-        else:
-            dirname = f"{num[:2]}xxx"
+    # Only pay for an index update when something we want isn't there yet
+    if len(found) < len(set(cves)):
+        index.update()
+        found = index.lookup(cves)
 
-        with open(os.path.expanduser(f"~/gentoo/cvelist/{year}/{dirname}/{cve}.json")) as f:
-            data = json.loads(f.read())
+    missing = [cve for cve in cves if cve not in found]
+    if missing:
+        print("No cvelist data for: {}".format(' '.join(missing)))
+        sys.exit(1)
 
-        cve_data.append(data)
+    # Whatever the last nvd-sync brought in, never a live lookup
+    nvd = NvdStore().lookup(cves)
+    for cve in cves:
+        found[cve]['nvd'] = nvd.get(cve)
 
-    return cve_data
+    return [found[cve] for cve in cves]
 
 
 def _startswith_any(string: str, substrings: List[str]):
@@ -196,7 +243,7 @@ def confirm():
     return 'y' in i.lower()
 
 
-def do_bug(bugdata, bug=None):
+def parse_bugdata(bugdata):
     params = {
         "product": "Gentoo Security",
         "component": "Vulnerabilities",
@@ -234,6 +281,12 @@ def do_bug(bugdata, bug=None):
     if len(params["description"]) > 16384:
         print("Can't file if description is longer than 16384 characters!")
 
+    return params
+
+
+def do_bug(bugdata, bug=None):
+    params = parse_bugdata(bugdata)
+
     if bug:
         # Hacky way to convert this from a bug creation to bug update
         # with a comment
@@ -246,14 +299,129 @@ def do_bug(bugdata, bug=None):
         cc = params['cc']
         params['cc'] = {}
         params['cc']['add'] = cc
-        bug = bgo.update_bugs([bug], params)
+        bug = gbugs.update_bugs([bug], params)
     else:
-        bug = file_bug(params)
         try:
-            print("Filed https://bugs.gentoo.org/{}".format(bug.json()['id']))
-        except KeyError:
-            print("Something went wrong filing the bug")
-            import pdb; pdb.set_trace()
+            bug = gbugs.file_bug(params)
+        except (gbugs.BugzillaError, requests.RequestException) as e:
+            print("Something went wrong filing the bug: {}".format(e))
+            sys.exit(1)
+        print("Filed https://bugs.gentoo.org/{}".format(bug))
+
+
+def manifest_parser():
+    # Manifest lines use the same options as a single secbug-file run, which
+    # is also what mozsec prints
+    parser = argparse.ArgumentParser(prog="manifest line", add_help=False)
+    parser.add_argument('-p', '--package', type=str, required=True)
+    parser.add_argument('-c', '--cves', type=str, required=False, nargs='+',
+                        default=[])
+    parser.add_argument('-w', '--whiteboard', type=str, required=False)
+    return parser
+
+
+def read_manifest(path):
+    """
+    Read a manifest of "-p cat/pkg -c CVE... [-w WHITEBOARD]" lines, one bug
+    per line, skipping blank lines and # comments
+    """
+    parser = manifest_parser()
+    entries = []
+    if path == '-':
+        # Not closed, the daemon client still looks at it afterwards
+        lines = sys.stdin.readlines()
+    else:
+        with open(path) as f:
+            lines = f.readlines()
+
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            entries.append(vars(parser.parse_args(shlex.split(line))))
+    return entries
+
+
+def prepare_drafts(entries):
+    """
+    Return a draft per manifest entry, with one CVE lookup for all of them.
+    Runs in ajakscripts-daemon if there is one.
+    """
+    all_cves = sorted({cve for entry in entries for cve in entry['cves']})
+    cve_data = {data['id']: data for data in get_cve_data(all_cves)} \
+        if all_cves else {}
+
+    drafts = []
+    for entry in entries:
+        cp = package_key(entry['package'])
+        if cp is None:
+            print("Package {} doesn't seem to exist!".format(entry['package']))
+            sys.exit(1)
+
+        cves = sorted(set(entry['cves']))
+        drafts.append(format_data(entry['package'], cves,
+                                  maintindex.maintainers(cp),
+                                  cve_data=[cve_data[cve] for cve in cves],
+                                  whiteboard=entry['whiteboard']))
+    return drafts
+
+
+def split_drafts(string):
+    """Split an edited batch back into drafts, dropping deleted/empty ones"""
+    drafts = []
+    current = None
+    for line in string.splitlines():
+        if line.startswith(DRAFT_SEPARATOR):
+            current = []
+            drafts.append(current)
+        elif current is not None:
+            current.append(line)
+    return ['\n'.join(draft) for draft in drafts if ''.join(draft).strip()]
+
+
+def file_drafts(drafts, jobs):
+    """File drafts concurrently, returning (summary, bug id or error) pairs"""
+    def file_one(draft):
+        params = parse_bugdata(draft)
+        try:
+            return params.get("summary"), gbugs.file_bug(params)
+        except (gbugs.BugzillaError, requests.RequestException) as e:
+            return params.get("summary"), "failed: {!r}".format(e)
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(file_one, drafts))
+
+
+def batch(manifest, jobs):
+    entries = read_manifest(manifest)
+    if not entries:
+        print("Empty manifest, nothing to file")
+        sys.exit(1)
+
+    drafts = client.prepare("ajakscripts.secbugfile", "prepare_drafts",
+                            entries)
+    string = ["# Delete a draft, separator line included, to skip filing it"]
+    for entry, draft in zip(entries, drafts):
+        string.append(DRAFT_SEPARATOR + entry['package'])
+        string.append(draft)
+
+    drafts = split_drafts(write_edit_read(get_editor(), '\n'.join(string)))
+    if not drafts:
+        print("Not filing")
+        sys.exit(0)
+
+    for draft in drafts:
+        print(parse_bugdata(draft).get("summary"))
+    i = input("File {} bugs? [yN] ".format(len(drafts)))
+    if 'y' not in i.lower():
+        print("Not filing")
+        sys.exit(0)
+
+    results = file_drafts(drafts, jobs)
+    width = max(len(summary or "") for summary, _ in results)
+    for summary, result in results:
+        if isinstance(result, int):
+            result = "https://bugs.gentoo.org/{}".format(result)
+        print("{:<{}}  {}".format(summary or "", width, result))
 
 
 def main():
@@ -261,36 +429,24 @@ def main():
     op_types = parser.add_mutually_exclusive_group(required=True)
     op_types.add_argument('-b', '--bug', type=int, required=False)
     op_types.add_argument('-p', '--package', type=str, required=False)
+    op_types.add_argument('-m', '--manifest', type=str, required=False,
+                          help="file a bug per line of this file, - for stdin")
     parser.add_argument('-c', '--cves', type=str, required=False, nargs='+')
+    parser.add_argument('-w', '--whiteboard', type=str, required=False)
     parser.add_argument('-n', '--nofetch', action='store_true', default=False)
+    parser.add_argument('-j', '--jobs', type=int, default=4,
+                        help="bugs to file at once in --manifest mode")
+    profiling.add_arguments(parser)
     args = parser.parse_args()
+    profiling.setup(args)
 
-    bug_data = None
-    alias = []
-    if args.bug:
-        bug_data = bgo.getbug(args.bug)
-        cc = bug_data.cc
-        alias = bug_data.alias
-    else:
-        atoms = cp_atom(args.package)
-        if len(atoms) < 1:
-            print("Package {} doesn't seem to exist!".format(args.package))
-            sys.exit(1)
-
-        atom = atoms[0]
-        cc = atom_maints(atom)
+    if args.manifest:
+        batch(args.manifest, args.jobs)
+        return
 
-    if args.cves:
-        alias = sorted(list(set(args.cves + alias)))
-
-    if args.nofetch:
-        data = edit_data(args.package, alias, cc)
-    else:
-        if args.cves:
-            cve_data = get_cve_data(args.cves)
-            data = edit_data(args.package, alias, cc, cve_data=cve_data, bug_data=bug_data)
-        else:
-            data = edit_data(args.package, alias, cc, bug_data=bug_data)
+    draft = client.prepare("ajakscripts.secbugfile", "prepare_draft",
+                           vars(args))
+    data = write_edit_read(get_editor(), draft)
 
     if not confirm():
         print("Not filing")
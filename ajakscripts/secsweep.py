@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import re
+
+from pkgcore.ebuild.cpv import VersionedCPV
+
+from ajakscripts import md5cache, profiling, repos, secwb
+
+# "<dev-libs/openssl-3.0.8" or "<=net-misc/curl-8.4.0:0", the atoms security
+# bug summaries start with
+_ATOM_RE = re.compile(r'^(?P<op><=?)(?P<cpv>[\w+.-]+/[\w+.-]+?)(:[\w+./-]*)?$')
+
+
+def summary_atoms(summary) -> list:
+    """
+    Return (op, cat/pkg, VersionedCPV) for every versioned upper bound in
+    the part of a summary before the first ": "
+    """
+    atoms = []
+    for token in re.split(r'[\s,]+', summary.split(': ', 1)[0]):
+        match = _ATOM_RE.match(token)
+        if not match:
+            continue
+        category, pv = match.group('cpv').split('/', 1)
+        split = md5cache.split_pv(pv)
+        if split is None:
+            continue
+        cp = f"{category}/{split[0]}"
+        atoms.append((match.group('op'), cp,
+                      VersionedCPV(match.group('cpv'))))
+    return atoms
+
+
+def is_stable(keywords):
+    return any(keyword[0] not in '~-' and keyword != '*'
+               for keyword in keywords.split())
+
+
+def load_versions(cps, repo_path) -> dict:
+    """
+    Return cat/pkg -> [(VersionedCPV, stable)] for cps, reading only the
+    md5-cache categories they're in
+    """
+    cps = set(cps)
+    versions = {cp: [] for cp in cps}
+    categories = sorted({cp.split('/')[0] for cp in cps})
+    for cp, pv, entry in md5cache.iter_entries(repo_path, keys=('KEYWORDS',),
+                                               categories=categories):
+        if cp in cps:
+            versions[cp].append((VersionedCPV(f"{cp}-{pv}"),
+                                 is_stable(entry.get('KEYWORDS', ''))))
+    return versions
+
+
+def _vulnerable(op, cpv, bound):
+    return cpv < bound if op == '<' else cpv <= bound
+
+
+def classify(atoms, versions):
+    """
+    Return "vulnerable-gone" if no vulnerable version of any package is left,
+    "fixed-stable" if every package has a stable fixed version, or None
+    """
+    gone = stable = True
+    for op, cp, bound in atoms:
+        cp_versions = versions.get(cp, [])
+        if not cp_versions:
+            # Treecleaned or renamed, nothing we can say from here
+            return None
+        if any(_vulnerable(op, cpv, bound) for cpv, _ in cp_versions):
+            gone = False
+        if not any(stable_keywords and not _vulnerable(op, cpv, bound)
+                   for cpv, stable_keywords in cp_versions):
+            stable = False
+
+    if gone:
+        return "vulnerable-gone"
+    if stable:
+        return "fixed-stable"
+    return None
+
+
+def suggest(bug, status) -> dict:
+    """
+    The update secbug-wb would suggest once the tree caught up, empty if
+    there's nothing to change
+    """
+    update = secwb.evaluate(secwb.stabilized(bug))
+    if status == "vulnerable-gone":
+        # Nothing left to clean up, don't ask for it
+        update['comment'] = {}
+        update['whiteboard'] = secwb.join_stages(
+            bug.whiteboard[:2],
+            [stage for stage in secwb.stages(update['whiteboard'])
+             if stage != 'cleanup'])
+    return secwb.prune(bug, update)
+
+
+@profiling.timed('sweep')
+def sweep(bugs, repo_path) -> list:
+    """Return a record for every bug the tree has moved past"""
+    atoms = {bug.id: summary_atoms(bug.summary) for bug in bugs}
+    versions = load_versions({cp for bug_atoms in atoms.values()
+                              for _, cp, _ in bug_atoms}, repo_path)
+
+    records = []
+    for bug in bugs:
+        # Bugs past stabilization (glsa?, cleanup) are waiting on us, not
+        # on the tree
+        if not atoms[bug.id] or secwb.check(bug) or \
+                secwb.past_stabilization(bug.whiteboard):
+            continue
+        status = classify(atoms[bug.id], versions)
+        if status is None:
+            continue
+        update = suggest(bug, status)
+        if not update:
+            continue
+        records.append({
+            'id': bug.id,
+            'alias': bug.alias,
+            'summary': bug.summary,
+            'status': status,
+            'whiteboard': bug.whiteboard,
+            'update': update,
+        })
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Find open security bugs the tree has already moved past")
+    parser.add_argument('-r', '--repo', type=str,
+                        help="defaults to pkgcore's gentoo repo")
+    parser.add_argument('-j', '--json', action='store_true', default=False)
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    profiling.setup(args)
+
+    bugs = secwb.open_security_bugs()
+    records = sweep(bugs, args.repo or repos.repo_path())
+
+    if args.json:
+        print(json.dumps(records, indent=2))
+        return
+
+    print("{} open security bugs, {} look stale".format(len(bugs),
+                                                        len(records)))
+    for record in records:
+        print("[{}] {}: {}".format(record['id'], record['status'],
+                                   record['summary']))
+        print("  {} -> {}".format(
+            record['whiteboard'],
+            record['update'].get('whiteboard', record['whiteboard'])))
+
+
+if __name__ == "__main__":
+    main()
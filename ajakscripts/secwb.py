@@ -0,0 +1,197 @@
+from types import SimpleNamespace
+import json
+
+from ajakscripts import gbugs
+
+SEC_EMAILS = ['security', 'security-kernel', 'security-audit']
+OPEN_STATUSES = ['UNCONFIRMED', 'CONFIRMED', 'IN_PROGRESS']
+# What evaluate() and prune() need to look at
+BUG_FIELDS = ['id', 'summary', 'alias', 'assigned_to', 'whiteboard', 'cc',
+              'keywords', 'severity', 'flags']
+# Comments evaluate() asks for, and the stage whose arrival they announce
+COMMENT_STAGES = {'Please cleanup': 'cleanup'}
+# Stages up to and including stabilization, and the ones only reached after
+STABLING_STAGES = {'upstream', 'upstream+', 'ebuild', 'ebuild+', 'stable?',
+                   'stable', 'stable+'}
+POST_STABLE_STAGES = {'glsa?', 'glsa', 'glsa+', 'cleanup'}
+
+
+def maybe_glsa(severity):
+    return severity in ['blocker', 'critical', 'major', 'normal', 'minor']
+
+
+def is_arch(email):
+    arch_mails = ['amd64', 'arm', 'arm64', 'hppa', 'ppc', 'ppc64', 'sparc',
+                  'x86', 's390']
+    return email in map(lambda x: x + '@gentoo.org', arch_mails)
+
+
+def is_sec_email(email):
+    return email in map(lambda x: x + '@gentoo.org', SEC_EMAILS)
+
+
+def stages(whiteboard) -> list:
+    """Split "B2 [stable? glsa?]" into its stage tokens, stable? and glsa?"""
+    return whiteboard[2:].replace('[', ' ').replace(']', ' ').split()
+
+
+def join_stages(evaluation, tokens) -> str:
+    """The inverse of stages(), "B2", ["glsa?"] -> "B2 [glsa?]"""
+    return evaluation + ' [' + ' '.join(tokens) + ']'
+
+
+def past_stabilization(whiteboard) -> bool:
+    """Whether the whiteboard has moved on from stabilization, e.g. glsa?"""
+    current = set(stages(whiteboard))
+    return bool(current & POST_STABLE_STAGES) and \
+        not current & STABLING_STAGES
+
+
+def stabilized(bug):
+    """
+    What evaluate() looks at of bug, as it'd be once the arches are done:
+    at the stable stage instead of any earlier one, and no arches CCed
+    """
+    current = [stage for stage in stages(bug.whiteboard)
+               if stage not in STABLING_STAGES]
+    return SimpleNamespace(
+        whiteboard=join_stages(bug.whiteboard[:2], ['stable'] + current),
+        cc=[email for email in bug.cc if not is_arch(email)],
+        keywords=bug.keywords,
+        severity=bug.severity,
+    )
+
+
+def check(bug):
+    """Return why bug can't be evaluated, or None if it can"""
+    if not is_sec_email(bug.assigned_to):
+        return "Not a security bug!"
+    if len(bug.whiteboard) == 0:
+        return "Bug has no whiteboard!"
+    return None
+
+
+def evaluate(bug) -> dict:
+    """Work out the update moving bug to the next whiteboard state"""
+    update = {}
+
+    # Go ahead and create an empty skeleton so we don't have to worry about
+    # doing it on demand. Since it's empty, it shouldn't do anything anyway.
+    update['keywords'] = {}
+    update['keywords']['add'] = []
+    update['keywords']['remove'] = []
+
+    update['flags'] = [{}]
+    update['comment'] = {}
+
+    evaluation = bug.whiteboard[:2]
+    wb_next = []
+
+    if any(is_arch(email) for email in bug.cc):
+        wb_next.append('stable')
+        if 'CC-ARCHES' not in bug.keywords:
+            update['keywords']['add'].append('CC-ARCHES')
+        if 'STABLEREQ' not in bug.keywords:
+            update['keywords']['add'].append('STABLEREQ')
+    elif 'stable?' in bug.whiteboard:
+        wb_next.append('stable?')
+
+    # A substring check would take stable? for stable, and a bug that
+    # hasn't even started stabling for one that's done. stable+ is done too.
+    done_stabling = any(stage in ('stable', 'stable+')
+                        for stage in stages(bug.whiteboard)) and \
+        not any(is_arch(email) for email in bug.cc)
+
+    if done_stabling:
+        update['keywords']['remove'] = ['CC-ARCHES', 'STABLEREQ']
+        update['flags'][0]['name'] = 'sanity-check'
+        update['flags'][0]['status'] = 'X'
+        update['comment']['body'] = 'Please cleanup'
+
+    if 'glsa+' in bug.whiteboard:
+        wb_next.append('glsa+')
+    elif (bug.severity != 'trivial' and
+          ('glsa?' in bug.whiteboard or 'ebuild' not in bug.whiteboard)) or \
+         (done_stabling or 'cleanup' in bug.whiteboard):
+        # If the severity isn't trivial, If glsa? was already there
+        wb_next.append('glsa?')
+    elif 'noglsa' in bug.whiteboard:
+        wb_next.append('noglsa')
+    elif 'glsa' in bug.whiteboard:
+        wb_next.append('glsa')
+
+    if done_stabling or 'cleanup' in bug.whiteboard:
+        wb_next.append('cleanup')
+
+    if 'cve' in bug.whiteboard:
+        wb_next.append('cve')
+
+    # Make sure the format is correct
+    update['whiteboard'] = join_stages(evaluation, wb_next)
+
+    return update
+
+
+def _flag_changes(bug, flag):
+    flags = getattr(bug, 'flags', None)
+    if flags is None:
+        # Not fetched, we can't tell
+        return True
+    current = {existing['name']: existing['status'] for existing in flags}
+    if flag['status'] == 'X':
+        return flag['name'] in current
+    return current.get(flag['name']) != flag['status']
+
+
+def prune(bug, update) -> dict:
+    """
+    Drop everything from an evaluate() update that wouldn't change bug:
+    empty parts, keywords it already has or doesn't have, flags already
+    set that way, comments announcing a stage it's already at and an
+    unchanged whiteboard. The result is empty when there's nothing to do,
+    so applying it twice never does anything the second time.
+    """
+    pruned = {}
+    keywords = {
+        'add': [keyword for keyword in update['keywords']['add']
+                if keyword not in bug.keywords],
+        'remove': [keyword for keyword in update['keywords']['remove']
+                   if keyword in bug.keywords],
+    }
+    keywords = {key: value for key, value in keywords.items() if value}
+    if keywords:
+        pruned['keywords'] = keywords
+
+    flags = [flag for flag in update['flags']
+             if flag and _flag_changes(bug, flag)]
+    if flags:
+        pruned['flags'] = flags
+
+    comment = update['comment']
+    stage = COMMENT_STAGES.get(comment.get('body'))
+    if comment and (stage is None or stage not in stages(bug.whiteboard)):
+        pruned['comment'] = comment
+
+    if update['whiteboard'] != bug.whiteboard:
+        pruned['whiteboard'] = update['whiteboard']
+    return pruned
+
+
+def open_security_bugs(page_size=gbugs.DEFAULT_PAGE_SIZE) -> list:
+    """Every open bug assigned to one of the security aliases"""
+    bgo = gbugs.get_bgo()
+    query = bgo.build_query(
+        assigned_to=[email + '@gentoo.org' for email in SEC_EMAILS],
+        status=OPEN_STATUSES,
+        include_fields=BUG_FIELDS,
+    )
+    return gbugs.query_all(query, page_size=page_size)
+
+
+def group_updates(updates):
+    """Group bugs by identical update payload, for batched update_bugs()"""
+    groups = {}
+    for bug, update in updates:
+        key = json.dumps(update, sort_keys=True)
+        groups.setdefault(key, (update, []))[1].append(bug)
+    return list(groups.values())
@@ -0,0 +1,28 @@
+from ajakscripts import maintindex, repos
+
+
+def stablereq_params(cpv) -> dict:
+    """
+    Return the fields of a stabilization request for cpv. This is the part
+    of stablereq-file.py that needs pkgcore, it runs in ajakscripts-daemon
+    if there is one.
+    """
+    params = {
+        "product": "Gentoo Linux",
+        "component": "Stabilization",
+        "description": "Please stabilize, thanks!",
+        "summary": cpv + ": stabilization",
+        "cf_stabilisation_atoms": cpv + " *",
+        "keywords": ["STABLEREQ"]
+    }
+
+    atom = repos.match('=' + cpv)[0]
+
+    maintainers = maintindex.maintainers(atom.key)
+
+    params["assigned_to"] = maintainers[0]
+
+    if len(maintainers) > 1:
+        params["cc"] = maintainers[1:]
+
+    return params
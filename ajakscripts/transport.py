@@ -0,0 +1,128 @@
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+import requests.adapters
+import urllib3.exceptions
+
+# Sustained requests per second and how many may go out back to back
+DEFAULT_RATE = 5
+DEFAULT_BURST = 10
+# Requests in flight at once per host, and the connection pool size
+DEFAULT_MAX_PER_HOST = 8
+DEFAULT_RETRIES = 4
+# Seconds, doubled for every retry and jittered
+DEFAULT_BACKOFF = 0.5
+MAX_BACKOFF = 30
+
+# Only these are retried on server errors and dropped connections. A Bugzilla
+# PUT isn't idempotent in practice: one carrying a comment that errors out
+# after the change went through would add the comment twice
+SAFE_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+# 429 means the request wasn't processed at all, the rest might have been
+THROTTLED = 429
+SERVER_ERRORS = {500, 502, 503, 504}
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Take a token, sleeping until there is one"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens +
+                                  (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def _not_sent(error) -> bool:
+    """Whether a request failed before it could reach the server"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    # requests wraps urllib3's MaxRetryError, which has the actual cause
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, urllib3.exceptions.NewConnectionError)
+
+
+class Session(requests.Session):
+    """
+    requests.Session that paces requests through a token bucket, caps how
+    many are in flight per host and retries safe (read-only) ones on
+    throttling, server errors and dropped connections with jittered
+    exponential backoff. Anything else is only retried on 429 or when the
+    connection couldn't be set up, since the server never acted on it; pass
+    retry=True to request() to retry it like a GET. throttled lists the
+    statuses a server answers with when it rate limits, for the ones that
+    don't use 429 for it.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST,
+                 max_per_host=DEFAULT_MAX_PER_HOST, retries=DEFAULT_RETRIES,
+                 backoff=DEFAULT_BACKOFF, throttled=(THROTTLED,)):
+        super().__init__()
+        self.bucket = TokenBucket(rate, burst)
+        self.max_per_host = max_per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.throttled = set(throttled)
+        self._hosts = {}
+        self._hosts_lock = threading.Lock()
+
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=max_per_host)
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+
+    def _host_slot(self, url):
+        host = urlsplit(url).netloc
+        with self._hosts_lock:
+            if host not in self._hosts:
+                self._hosts[host] = threading.BoundedSemaphore(
+                    self.max_per_host)
+            return self._hosts[host]
+
+    def delay(self, attempt, response=None):
+        """Sleep before retry number attempt (counting from 0)"""
+        retry_after = response.headers.get('Retry-After') \
+            if response is not None else None
+        if retry_after and retry_after.isdigit():
+            seconds = int(retry_after)
+        else:
+            # "Full jitter" so that concurrent workers don't retry in lockstep
+            seconds = random.uniform(0, self.backoff * 2 ** attempt)
+        time.sleep(min(seconds, MAX_BACKOFF))
+
+    def request(self, method, url, *args, retry=None, **kwargs):
+        if retry is None:
+            retry = method.upper() in SAFE_METHODS
+
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            self.bucket.acquire()
+            try:
+                with self._host_slot(url):
+                    response = super().request(method, url, *args, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if last or not (retry or _not_sent(e)):
+                    raise
+                self.delay(attempt)
+                continue
+
+            status = response.status_code
+            if last or not (status in self.throttled or
+                            retry and status in SERVER_ERRORS):
+                return response
+            self.delay(attempt, response)
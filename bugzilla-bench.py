@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+"""
+Drive the Bugzilla-facing tools against a local stand-in and report how
+many API round trips each makes, how long it takes and how many bytes go
+over the wire.
+
+The spec is a JSON list of runs, e.g.:
+
+    [
+        {"name": "bscve", "argv": ["python", "-m", "ajakscripts.bscve"],
+         "stdin": "CVE-2023-1234 CVE-2023-5678\\n", "max_requests": 2},
+        {"name": "glsa-all-done",
+         "argv": ["python", "-m", "ajakscripts.glsaalldone", "-n",
+                  "900001", "900002"]}
+    ]
+
+Runs are started from the repository root with GBUGS_URL pointing at the
+stand-in, a throwaway HOME with a dummy ~/.bugzrc, EDITOR=true and a fresh
+cache directory per run unless --warm is given. "stdin" defaults to "n\\n"
+so confirmation prompts decline. Fixtures are recorded with bz-standin -r.
+
+Without -f and -s, fixtures/bench.json is replayed against
+fixtures/bugzilla.json, covering bscve, glsa-all-done, secbug-file,
+secbug-wb.py and gpyutils-stablereqs-file.py. fixtures/bin comes first on
+PATH so the commands the tools shell out to (gpy-upgrade-impl) are
+replayed too.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+from ajakscripts.bzstandin import StandIn, parse_faults
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(REPO_ROOT, 'fixtures')
+
+
+def make_env(home, url, cache_dir):
+    with open(os.path.join(home, '.bugzrc'), 'w') as f:
+        f.write("[default]\nkey = bench\n")
+
+    env = dict(os.environ)
+    env.update({
+        'HOME': home,
+        'GBUGS_URL': url,
+        'EDITOR': 'true',
+        'XDG_CACHE_HOME': cache_dir,
+        'PATH': os.path.join(FIXTURES_DIR, 'bin') + os.pathsep +
+                env.get('PATH', ''),
+        'PYTHONPATH': REPO_ROOT + os.pathsep + env.get('PYTHONPATH', ''),
+    })
+    return env
+
+
+def run(standin, env, spec):
+    requests.post(standin.url + '/__reset__')
+
+    start = time.perf_counter()
+    proc = subprocess.run(spec['argv'], input=spec.get('stdin', 'n\n'),
+                          cwd=REPO_ROOT, env=env, text=True,
+                          capture_output=True)
+    wall = time.perf_counter() - start
+
+    stats = requests.get(standin.url + '/__stats__').json()
+    stats.update({'name': spec['name'], 'wall': wall,
+                  'returncode': proc.returncode})
+    if proc.returncode != 0:
+        stats['stderr'] = proc.stderr[-2000:]
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-f', '--fixtures', type=str,
+                        default=os.path.join(FIXTURES_DIR, 'bugzilla.json'))
+    parser.add_argument('-s', '--spec', type=str,
+                        default=os.path.join(FIXTURES_DIR, 'bench.json'))
+    parser.add_argument('-l', '--latency', type=float, default=0,
+                        help="milliseconds of simulated latency per request")
+    parser.add_argument('-r', '--repeat', type=int, default=1)
+    parser.add_argument('-w', '--warm', action='store_true', default=False,
+                        help="keep the on-disk caches between runs")
+    parser.add_argument('-F', '--faults', type=parse_faults, default={},
+                        help="inject errors, e.g. 429:0.1,503:0.05, see "
+                             "bz-standin")
+    parser.add_argument('-j', '--json', action='store_true', default=False)
+    args = parser.parse_args()
+
+    with open(args.spec) as f:
+        specs = json.load(f)
+
+    standin = StandIn(args.fixtures, latency=args.latency / 1000,
+                      faults=args.faults, seed=0).start()
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as home:
+            for spec in specs:
+                for _ in range(args.repeat):
+                    cache_dir = os.path.join(home, 'cache')
+                    if not args.warm:
+                        cache_dir = tempfile.mkdtemp(dir=home)
+                    env = make_env(home, standin.url, cache_dir)
+                    results.append(run(standin, env, spec))
+    finally:
+        standin.stop()
+
+    over_budget = [result['name'] for result, spec in
+                   zip(results, [s for s in specs for _ in range(args.repeat)])
+                   if 'max_requests' in spec and
+                   result['requests'] > spec['max_requests']]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        width = max(len(result['name']) for result in results)
+        # bytes_in/bytes_out are from the stand-in's point of view
+        print(f"{'name':<{width}}  requests  wall (s)      sent  received  rc")
+        for result in results:
+            print(f"{result['name']:<{width}}  {result['requests']:>8}  "
+                  f"{result['wall']:>8.3f}  {result['bytes_in']:>8}  "
+                  f"{result['bytes_out']:>8}  {result['returncode']}")
+
+    if over_budget:
+        print("Over their request budget: " + " ".join(over_budget),
+              file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,16 @@
 #!/usr/bin/env python
 
-from configparser import ConfigParser
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import argparse
 import os
 import subprocess
 import sys
 
 import requests
-import pkgcore.config
-from pkgcore.ebuild import atom as atom_mod
 
-BZ_API = "https://bugs.gentoo.org/rest/{endpoint}"
+from ajakscripts import gbugs, maintindex, profiling, pycompat
+
+BZ_API = gbugs.BZ_URL + "/rest/{endpoint}"
 
 
 def run_shell(string):
@@ -29,79 +30,78 @@ def get_package_list(old, new):
     return [x.split(" ")[0] for x in stdout.decode().split("\n") if x]
 
 
-def find_stablereqs(session, cpv) -> list:
+def find_stablereqs(session, cpvs) -> dict:
+    """
+    Search for open bugs with any of cpvs as a substring of
+    cf_stabilisation_atoms in a single query, returning a dict of
+    cpv -> bugs
+    """
+    # f1..fN form a boolean chart OR group: one substring term per cpv
     params = {
-        # Search for cpv as a substring of cf_stabilisation_atoms
-        "v1": cpv,
-        "o1": "substring",
-        "f1": "cf_stabilisation_atoms",
-
-        # But ignore keywording bugs
-        "f2": "component",
-        "o2": "notequals",
-        "v2": "Keywording",
-
-        "resolution": "---"
+        "f1": "OP",
+        "j1": "OR",
     }
-
-    print("Searching for stabilization bugs including {}".format(cpv))
-    req = session.get(BZ_API.format(endpoint="bug"), params=params)
-    bugs = req.json()['bugs']
-    return bugs
-
-
-def find_normal_use(repo, cp):
-    atom = atom_mod.atom(cp + '[python_targets_python3_9]')
-    return repo.match(atom)
-
-
-def find_single_use(repo, cp):
-    atom = atom_mod.atom(cp + '[python_single_target_eython3_9]')
-    return repo.match(atom)
-
-
-def find_python_compat(repo, cp):
-    atom = atom_mod.atom(cp)
-    matches = []
-
-    for pkg in repo.match(atom):
-        # Environment is straight from the environment file, a hacky solution
-        # is catching if the python implementation is in that
-        line = [line for line in pkg.environment.data.split('\n')
-                if "PYTHON_COMPAT=" in line]
-
-        # Sometimes version 1 of a package has no PYTHON_COMPAT line
-        # where b does, so check if we actually a PYTHON_COMPAT first
-        if len(line):
-            if "python3_9" in line[0]:
-                matches.append(pkg)
-
-    return matches
-
-
-def get_suitable_version(cpv):
-    repo = pkgcore.config.load_config().repo['gentoo']
-
-    matches = find_normal_use(repo, cpv)
-
-    if len(matches) == 0:
-        matches = find_single_use(repo, cpv)
-    if len(matches) == 0:
-        matches = find_python_compat(repo, cpv)
-
-    return [match for match in matches
-            if not match.live]
-
-
-def atom_maints(atom) -> list:
-    # Get list of strings per maintainer object
-    strings = [str(maint) for maint in atom.maintainers]
-
-    # Slice off the name, get the <email>
-    mails = [maint.split(" ")[-1] for maint in strings]
-
-    # Return list of plain emails
-    return [mail.replace("<", "").replace(">", "") for mail in mails]
+    field = 2
+    for cpv in cpvs:
+        params["f{}".format(field)] = "cf_stabilisation_atoms"
+        params["o{}".format(field)] = "substring"
+        params["v{}".format(field)] = cpv
+        field += 1
+    params["f{}".format(field)] = "CP"
+
+    # But ignore keywording bugs
+    params["f{}".format(field + 1)] = "component"
+    params["o{}".format(field + 1)] = "notequals"
+    params["v{}".format(field + 1)] = "Keywording"
+
+    params["resolution"] = "---"
+    params["include_fields"] = "id,cf_stabilisation_atoms"
+
+    try:
+        req = session.get(BZ_API.format(endpoint="bug"), params=params)
+        req.raise_for_status()
+        data = req.json()
+    except (requests.RequestException, ValueError) as e:
+        error = str(e)
+    else:
+        # Bugzilla reports some failures as a 200 with an error body
+        error = None if 'bugs' in data else \
+            data.get('message', "no bugs in the response")
+    if error:
+        # Leave the whole batch out, an empty result would read as "no
+        # stablereq filed yet"
+        print("\nSearching for stabilization bugs for {} failed: {}".format(
+            " ".join(cpvs), error), file=sys.stderr)
+        return {}
+    bugs = data['bugs']
+
+    # Split the hits back up per package the same way Bugzilla matched them
+    return {cpv: [bug for bug in bugs
+                  if cpv in (bug.get('cf_stabilisation_atoms') or '')]
+            for cpv in cpvs}
+
+
+def find_all_stablereqs(session, cpvs, jobs, batch_size) -> dict:
+    batches = [cpvs[i:i + batch_size]
+               for i in range(0, len(cpvs), batch_size)]
+    results = {}
+    done = 0
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(find_stablereqs, session, batch): batch
+                   for batch in batches}
+        for future in as_completed(futures):
+            results.update(future.result())
+            done += len(futures[future])
+            print("\rSearching for stabilization bugs: {}/{}".format(
+                done, len(cpvs)), end="", file=sys.stderr, flush=True)
+
+    print(file=sys.stderr)
+    return results
+
+
+def get_suitable_version(cp, impl):
+    return pycompat.versions_supporting(cp, impl)
 
 
 def set_blocker(session, blocker, bug_id, apikey):
@@ -113,36 +113,30 @@ def set_blocker(session, blocker, bug_id, apikey):
     req = session.post(BZ_API.format(endpoint="bug"), params=params)
 
 
-def file_stablereq(session, blocker, apikey, cpv):
+def file_stablereq(session, blocker, apikey, cpv, impl):
     params = {
-        "Bugzilla_api_key": apikey,
-
         "product": "Gentoo Linux",
         "component": "Stabilization",
-        "version": "unspecified",
         "description": "Please stabilize.",
         "blocks": blocker,
     }
 
-    package = get_suitable_version(cpv)[0]
-    package_str = str(package.versioned_atom).replace("=", "")
-    params["cf_stabilisation_atoms"] = package_str + " *"
-
-    if package.live:
-        print("Can't file for live package: " + cpv)
+    # Live ebuilds are never suitable
+    versions = get_suitable_version(cpv, impl)
+    if not versions:
+        print("No non-live version of {} supports {}".format(cpv, impl))
         return
 
-    maintainers = atom_maints(package)
+    package_str = versions[0]
+    params["cf_stabilisation_atoms"] = package_str + " *"
+
+    maintainers = maintindex.maintainers(cpv)
 
     params["summary"] = package_str + \
-        ": stabilization for python3_9"
+        ": stabilization for " + impl
 
-    # Sometimes the maintainer list ends up being empty in the case of
-    # m-n packages
-    if maintainers:
-        params["assigned_to"] = maintainers[0]
-    else:
-        params["assigned_to"] = 'maintainer-needed@gentoo.org'
+    # m-n packages come back as maintainer-needed@gentoo.org
+    params["assigned_to"] = maintainers[0]
 
     if len(maintainers) > 1:
         params["cc"] = maintainers[1:]
@@ -150,8 +144,11 @@ def file_stablereq(session, blocker, apikey, cpv):
     print(params)
     i = input("File bug? [yN] ")
     if 'y' in i.lower():
-        req = session.post(BZ_API.format(endpoint="bug"), params=params)
-        print(req.json()['id'])
+        # One failure shouldn't stop us from filing for the other packages
+        try:
+            print(gbugs.file_bug(params))
+        except (gbugs.BugzillaError, requests.RequestException) as e:
+            print("{}: failed: {!r}".format(params["summary"], e))
 
     #set_blocker(session, blocker, req.json()["id"], apikey)
     # TODO: set_blocker is broken and it should add package list and leading =
@@ -159,20 +156,35 @@ def file_stablereq(session, blocker, apikey, cpv):
 
 
 if __name__ == "__main__":
-    session = requests.Session()
-    params = {}
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-j', '--jobs', type=int, default=4,
+                        help="number of concurrent queries to bugs.gentoo.org")
+    parser.add_argument('-b', '--batch-size', type=int, default=20,
+                        help="number of packages to look up per query")
+    parser.add_argument('old', help="e.g. python3_11, or just 3_11")
+    parser.add_argument('new', help="e.g. python3_12, or just 3_12")
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    profiling.setup(args)
+
+    old, new = [impl if not impl[0].isdigit() else "python" + impl
+                for impl in (args.old, args.new)]
+
     bugzrc = os.path.expanduser("~/.bugzrc")
 
     if not os.path.isfile(bugzrc):
         print("Can't access {}".format(bugzrc))
         sys.exit(-1)
 
-    config = ConfigParser()
-    config.read(bugzrc)
-    apikey = config['default']['key']
+    apikey = gbugs.get_api_key()
 
-    packages = get_package_list("python" + sys.argv[1], "python" + sys.argv[2])
+    # Shared with gbugs, which paces and caps the connections for all of
+    # the workers
+    session = gbugs.get_session()
 
+    packages = get_package_list(old, new)
+
+    to_check = {}
     for cpv in packages:
         if "heimdal" in cpv:
             continue
@@ -183,10 +195,19 @@ if __name__ == "__main__":
             print("Naively not processing nonzero slot: {}".format(cpv))
             continue
 
-        bugs = find_stablereqs(session, pn)
+        to_check[cpv] = pn
+
+    stablereqs = find_all_stablereqs(session, sorted(set(to_check.values())),
+                                     args.jobs, args.batch_size)
+
+    for cpv, pn in to_check.items():
+        if pn not in stablereqs:
+            # Its search failed, which was reported above
+            continue
+        bugs = stablereqs[pn]
 
         if len(bugs) == 0:
-            file_stablereq(session, 788658, apikey, pn)
+            file_stablereq(session, 788658, apikey, pn, new)
             print("Need to file for {cpv}".format(cpv=cpv))
         else:
             # TODO: an improvement would be checking that bugs here are
@@ -1,35 +1,335 @@
 #!/usr/bin/env python
 
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
+import os
 import sys
+
 import requests
-import json
 
+from ajakscripts import cache, profiling
 
-def urldata(url):
-    response = requests.get(url, headers={"accept": "application/json"})
-    if response.status_code != 200:
-        print('{} status code for URL: {}'.format(response.status_code, url))
-        print(response.content)
-        sys.exit(1)
-    return response.content
+BASE_URL = "https://api.msrc.microsoft.com/cvrf/v2.0/"
 
 
-if __name__ == "__main__":
-    cves = list(set(sys.argv[1:]))
-    baseurl = "https://api.msrc.microsoft.com/cvrf/v2.0/"
+class MsrcError(Exception):
+    def __init__(self, status, url):
+        super().__init__(f"{status} status code for URL: {url}")
+        self.status = status
+
+
+def get_session(jobs):
+    session = requests.Session()
+    session.headers["accept"] = "application/json"
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=jobs)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return profiling.wrap(session, ['request'], 'http')
 
+
+def urldata(session, url, headers=None):
+    # Raised rather than exiting, this runs in worker threads and one bad
+    # URL shouldn't take every other lookup down with it
+    response = session.get(url, headers=headers)
+    if response.status_code not in (200, 304):
+        raise MsrcError(response.status_code, url)
+    return response
+
+
+def rebase(url, baseurl):
+    """
+    Point a CvrfUrl, which always names the real API, at baseurl so a
+    stand-in serves the documents too
+    """
+    if url.startswith(BASE_URL):
+        return baseurl + url[len(BASE_URL):]
+    return url
+
+
+def find_cvrf_urls(session, baseurl, cve) -> list:
     # to get CVE data, need to find the "Cvrf" that contains it from
     # the "Updates" endpoint
     # https://api.msrc.microsoft.com/cvrf/v2.0/swagger/index
-    update_feeds = [baseurl + f"Updates('{cve}')" for cve in cves]
-    update_jsons = [json.loads(urldata(feed)) for feed in update_feeds]
-    cvrfs = list(set([j['value'][0]['CvrfUrl'] for j in update_jsons]))
-    cve_jsons = [json.loads(urldata(cvrf))['Vulnerability'] for cvrf in cvrfs]
-    our_cves = [list(filter(lambda x: x['CVE'] in cves, data)) for data in cve_jsons]
+    try:
+        data = urldata(session, baseurl + f"Updates('{cve}')").json()
+    except MsrcError as e:
+        if e.status == 404:
+            # MSRC doesn't know the CVE
+            return []
+        raise
+    return [rebase(update['CvrfUrl'], baseurl) for update in data['value']]
+
+
+def attempt(func, *args):
+    """Return (func(*args), None), or (None, the error) if it failed"""
+    try:
+        return func(*args), None
+    except (MsrcError, requests.RequestException, ValueError) as e:
+        return None, e
+
+
+def matches_product(remediation, product_filter):
+    return not product_filter or any(
+        product_filter.lower() in product.lower()
+        for product in remediation['Products'])
+
+
+def extract_vulnerabilities(cvrf) -> dict:
+    """
+    Boil a CVRF document down to CVE -> remediations, with product IDs
+    resolved to names, which is all we ever look at
+    """
+    products = {product['ProductID']: product['Value'] for product in
+                cvrf.get('ProductTree', {}).get('FullProductName', [])}
+
+    vulns = {}
+    for vuln in cvrf.get('Vulnerability', []):
+        vulns[vuln['CVE']] = [{
+            'FixedBuild': remediation.get('FixedBuild'),
+            'Products': [products.get(pid, pid)
+                         for pid in remediation.get('ProductID', [])],
+            'Type': remediation.get('Type'),
+            'URL': remediation.get('URL'),
+        } for remediation in vuln.get('Remediations', [])]
+    return vulns
+
+
+def cvrf_cache_path(url):
+    # .../cvrf/2023-Jan -> msrc/2023-Jan.json
+    name = url.rstrip('/').split('/')[-1]
+    os.makedirs(cache.cache_path('msrc'), exist_ok=True)
+    return cache.cache_path(os.path.join('msrc', name + '.json'))
+
+
+@profiling.timed('msrc.load_cvrf')
+def load_cvrf(session, url) -> dict:
+    """
+    Return the vulnerabilities of the CVRF document at url, revalidating
+    our copy on disk with a conditional GET and only downloading and
+    parsing the (multi-megabyte) document when it changed
+    """
+    path = cvrf_cache_path(url)
+    cached = None
+    headers = {}
+    try:
+        with open(path) as f:
+            cached = json.load(f)
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+    except (OSError, ValueError):
+        pass
+
+    response = urldata(session, url, headers)
+    if response.status_code == 304 and cached:
+        return cached['vulnerabilities']
+
+    cached = {
+        'url': url,
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'vulnerabilities': extract_vulnerabilities(response.json()),
+    }
+    with open(path + '.tmp', 'w') as f:
+        json.dump(cached, f)
+    os.replace(path + '.tmp', path)
+
+    return cached['vulnerabilities']
+
 
-    # flatten into a raw list rather than a list of CVE data lists
-    our_cves = [y for x in our_cves for y in x]
+def read_cached_cvrf(url):
+    """
+    Return the vulnerabilities of our copy on disk of the CVRF document at
+    url, or None if there's no readable copy
+    """
+    try:
+        with open(cvrf_cache_path(url)) as f:
+            return json.load(f)['vulnerabilities']
+    except (OSError, ValueError, KeyError):
+        return None
 
-    for cve in our_cves:
+
+def load_index():
+    try:
+        with open(cache.cache_path('msrc-index.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'releases': {}, 'cves': {}}
+
+
+def save_index(index):
+    path = cache.cache_path('msrc-index.json')
+    with open(path + '.tmp', 'w') as f:
+        json.dump(index, f)
+    os.replace(path + '.tmp', path)
+
+
+def sync(session, baseurl, jobs):
+    """
+    Download every CVRF document that is new or was re-released since the
+    last sync and rebuild the CVE -> product -> remediations index,
+    returning the IDs of the documents we couldn't download
+    """
+    index = load_index()
+    updates = urldata(session, baseurl + "updates").json()['value']
+
+    # A document whose copy on disk went missing has to be downloaded again
+    # even if it wasn't re-released, or its CVEs drop out of the index
+    cached = {update['ID']: read_cached_cvrf(update['CvrfUrl'])
+              for update in updates}
+    changed = [update for update in updates
+               if cached[update['ID']] is None or
+               index['releases'].get(update['ID']) !=
+               update.get('CurrentReleaseDate')]
+    print(f"{len(changed)} of {len(updates)} CVRF documents changed",
+          file=sys.stderr)
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        results = executor.map(
+            lambda update: attempt(load_cvrf, session,
+                                   rebase(update['CvrfUrl'], baseurl)),
+            changed)
+        failed = set()
+        for update, (vulns, error) in zip(changed, results):
+            if error:
+                print(f"Skipping {update['ID']}: {error}", file=sys.stderr)
+                failed.add(update['ID'])
+            else:
+                cached[update['ID']] = vulns
+
+    # Rebuilding from the cached documents is cheap and keeps CVEs that got
+    # moved or dropped in a re-release from lingering
+    cves = {}
+    for update in sorted(updates, key=lambda update: update['ID']):
+        vulns = cached[update['ID']]
+        if vulns is None:
+            continue
+        for cve, remediations in vulns.items():
+            products = cves.setdefault(cve, {})
+            for remediation in remediations:
+                for product in remediation['Products']:
+                    products.setdefault(product, []).append({
+                        key: remediation[key]
+                        for key in ('FixedBuild', 'Type', 'URL')})
+
+    # Failed documents keep their old release date so the next sync tries
+    # them again
+    index['releases'] = {
+        update['ID']: index['releases'].get(update['ID'])
+        if update['ID'] in failed else update.get('CurrentReleaseDate')
+        for update in updates}
+    index['cves'] = cves
+    save_index(index)
+    return failed
+
+
+def query_offline(cves, product_filter=None):
+    cve_index = load_index()['cves']
+    if not cve_index:
+        print("No local index, run with --sync first")
+        sys.exit(1)
+
+    for cve in cves:
+        builds = []
+        for product, remediations in sorted(cve_index.get(cve, {}).items()):
+            if product_filter and product_filter.lower() not in product.lower():
+                continue
+            for remediation in remediations:
+                build = remediation['FixedBuild']
+                if build and build not in builds:
+                    builds.append(build)
+        if cve not in cve_index:
+            print(f"{cve}: not in any CVRF document")
+        else:
+            print(f"{cve}: " + " ".join(builds))
+
+
+def read_cves(args):
+    cves = list(args.cves)
+    if args.file:
+        f = sys.stdin if args.file == '-' else open(args.file)
+        with f:
+            cves += f.read().split()
+    return sorted(set(cves))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-j', '--jobs', type=int, default=8)
+    parser.add_argument('--base-url', type=str, default=BASE_URL,
+                        help="MSRC CVRF API to talk to, e.g. a local "
+                             "bz-standin -f fixtures/msrc.json at "
+                             "http://127.0.0.1:8080/cvrf/v2.0/")
+    parser.add_argument('-s', '--sync', action='store_true', default=False,
+                        help="update the local CVE -> FixedBuild index")
+    parser.add_argument('-o', '--offline', action='store_true', default=False,
+                        help="answer from the local index only")
+    parser.add_argument('-f', '--file', type=str,
+                        help="read CVEs from a file, - for stdin")
+    parser.add_argument('-p', '--product', type=str,
+                        help="only builds for products containing this, "
+                             "e.g. '.NET'")
+    parser.add_argument('cves', nargs='*')
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    profiling.setup(args)
+
+    cves = read_cves(args)
+    baseurl = args.base_url.rstrip('/') + '/'
+    session = get_session(args.jobs)
+
+    sync_failed = bool(args.sync and sync(session, baseurl, args.jobs))
+    if args.offline:
+        query_offline(cves, args.product)
+        sys.exit(int(sync_failed))
+    if not cves:
+        if not args.sync:
+            parser.error("no CVEs given")
+        sys.exit(int(sync_failed))
+
+    # CVE -> why we couldn't answer for it
+    failed = {}
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        cvrf_urls = {}
+        for cve, (urls, error) in zip(cves, executor.map(
+                lambda cve: attempt(find_cvrf_urls, session, baseurl, cve),
+                cves)):
+            if error:
+                failed[cve] = error
+            elif not urls:
+                print(f"{cve}: not in any CVRF document")
+            else:
+                cvrf_urls[cve] = urls
+
+        urls = sorted({url for urls in cvrf_urls.values() for url in urls})
+        documents = executor.map(
+            lambda url: attempt(load_cvrf, session, url), urls)
+
+        found = {}
+        for url, (vulns, error) in zip(urls, documents):
+            for cve in cvrf_urls:
+                if url not in cvrf_urls[cve]:
+                    continue
+                if error:
+                    failed.setdefault(cve, error)
+                elif cve in vulns:
+                    found.setdefault(cve, []).extend(vulns[cve])
+
+    for cve, remediations in sorted(found.items()):
+        if cve in failed:
+            continue
         # now output all the build numbers we're looking for
-        print(f"{cve['CVE']}: " + " ".join(list(map(lambda x: x['FixedBuild'], cve['Remediations']))))
+        print(f"{cve}: " + " ".join(remediation['FixedBuild']
+                                    for remediation in remediations
+                                    if remediation['FixedBuild'] and
+                                    matches_product(remediation, args.product)))
+    for cve, error in sorted(failed.items()):
+        print(f"{cve}: failed: {error}")
+    if failed or sync_failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
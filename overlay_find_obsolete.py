@@ -1,40 +1,204 @@
 #!/usr/bin/env python
 
-import sys
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import json
+import os
 
-import pkgcore.config
-from pkgcore.ebuild import atom as atom_mod
+from pkgcore.ebuild.cpv import VersionedCPV
 
+from ajakscripts import md5cache, profiling, repos
 
-def find_obsolete_packages(primary, secondary):
+# Set in each worker process by _init_worker(), cp -> min primary version
+_primary_index = None
+
+# Top-level directories of an ebuild repo that are never categories
+NOT_CATEGORIES = {'eclass', 'licenses', 'metadata', 'profiles', 'scripts'}
+
+
+def iter_ebuild_versions(repo_path, categories):
+    """Yield (cp, pv) for every ebuild in categories, straight from disk"""
+    for category in categories:
+        try:
+            packages = os.listdir(os.path.join(repo_path, category))
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        for package in packages:
+            try:
+                names = os.listdir(os.path.join(repo_path, category, package))
+            except NotADirectoryError:
+                continue
+            for name in names:
+                if not name.endswith('.ebuild'):
+                    continue
+                split = md5cache.split_pv(name[:-len('.ebuild')])
+                if split and split[0] == package:
+                    yield f"{category}/{package}", split[1]
+
+
+def repo_categories(repo_path):
+    with open(os.path.join(repo_path, 'profiles', 'categories')) as f:
+        return f.read().split()
+
+
+def overlay_categories(overlay_path):
     """
-    Find packages in secondary whose versions are all superceded by
-    package versions in primary
+    Every directory of an overlay that could be a category. Overlays often
+    list only some of theirs in profiles/categories, or none and inherit
+    the list from their masters, so that file can't be trusted.
     """
-    for category in secondary.packages:
-        for package in secondary.packages[category]:
-            cp = '{}/{}'.format(category, package)
-            secondary_pkg = secondary.match(atom_mod.atom(cp))
-            primary_pkg = primary.match(atom_mod.atom(cp))
-
-            if not primary_pkg:
-                print("Primary repo doesn't have '{}', ignoring".format(cp))
+    with os.scandir(overlay_path) as entries:
+        return sorted(entry.name for entry in entries
+                      if entry.is_dir() and not entry.name.startswith('.')
+                      and entry.name not in NOT_CATEGORIES)
+
+
+def build_primary_index(repo_path) -> dict:
+    """Map every cp in the primary repo to its lowest version, in one pass"""
+    if md5cache.has_md5_cache(repo_path):
+        versions = ((cp, pv) for cp, pv, _ in md5cache.iter_cpvs(repo_path))
+    else:
+        versions = iter_ebuild_versions(repo_path, repo_categories(repo_path))
+
+    index = {}
+    for cp, pv in versions:
+        cpv = VersionedCPV(f"{cp}-{pv}")
+        if cp not in index or cpv < index[cp]:
+            index[cp] = cpv
+    return {cp: cpv.fullver for cp, cpv in index.items()}
+
+
+def find_obsolete_packages(primary_index, overlay, overlay_path, categories):
+    """
+    Compare the packages of an overlay in categories against primary_index,
+    returning a record for every package where the primary repo supersedes
+    all (status "obsolete") or some ("partial") of the overlay's versions,
+    or doesn't have the package at all ("missing")
+    """
+    overlay_versions = {}
+    for cp, pv in iter_ebuild_versions(overlay_path, categories):
+        overlay_versions.setdefault(cp, []).append(VersionedCPV(f"{cp}-{pv}"))
+
+    records = []
+    for cp, versions in sorted(overlay_versions.items()):
+        overlay_max = max(versions)
+        if cp not in primary_index:
+            records.append({
+                "overlay": overlay,
+                "cp": cp,
+                "overlay_max": overlay_max.fullver,
+                "primary_min": "",
+                "status": "missing",
+            })
+            continue
+
+        primary_min = VersionedCPV(f"{cp}-{primary_index[cp]}")
+        superseded = [cpv for cpv in versions if cpv < primary_min]
+
+        # If the maximum in the overlay is lesser than the minimum of the
+        # packages in the primary repo, then the primary repo fully
+        # supercedes the packages in the overlay and the package may no
+        # longer be necessary in the overlay
+        if overlay_max < primary_min:
+            status = "obsolete"
+        elif superseded:
+            status = "partial"
+        else:
+            continue
+
+        records.append({
+            "overlay": overlay,
+            "cp": cp,
+            "overlay_max": overlay_max.fullver,
+            "primary_min": primary_min.fullver,
+            "status": status,
+        })
+    return records
+
+
+def _init_worker(primary_index):
+    global _primary_index
+    _primary_index = primary_index
+
+
+def _work(shard):
+    overlay, overlay_path, categories = shard
+    return find_obsolete_packages(_primary_index, overlay, overlay_path,
+                                  categories)
+
+
+def configured_overlays(primary):
+    """Return {name: location} of every configured ebuild repo but primary"""
+    overlays = {}
+    for name, repo in repos.get_config().objects.repo.items():
+        location = getattr(repo, 'location', None)
+        if name == primary or not location:
+            continue
+        if os.path.isdir(os.path.join(location, 'profiles')):
+            overlays[name] = location
+    return overlays
+
+
+def print_records(records, fmt):
+    if fmt == "json":
+        print(json.dumps(records, indent=2))
+    elif fmt == "tsv":
+        for record in records:
+            print("\t".join(record[key] for key in
+                            ("overlay", "cp", "overlay_max", "primary_min",
+                             "status")))
+    else:
+        for record in records:
+            if record["status"] == "missing":
+                print("Primary repo doesn't have '{}::{}', ignoring".format(
+                    record["cp"], record["overlay"]))
                 continue
+            line = "{}::{}".format(record["cp"], record["overlay"])
+            if record["status"] == "partial":
+                line += " (partially superseded)"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Find overlay packages superseded by the primary repo")
+    parser.add_argument('-a', '--all', action='store_true', default=False,
+                        help="check every configured overlay")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count())
+    parser.add_argument('-f', '--format', choices=["text", "tsv", "json"],
+                        default="text")
+    parser.add_argument('primary')
+    parser.add_argument('overlays', nargs='*')
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    profiling.setup(args)
+
+    if args.all:
+        overlays = configured_overlays(args.primary)
+    elif args.overlays:
+        overlays = {name: repos.get_repo(name).location
+                    for name in args.overlays}
+    else:
+        parser.error("give some overlays or --all")
+
+    primary_index = build_primary_index(repos.get_repo(args.primary).location)
+
+    # One shard per overlay category keeps the workers evenly loaded no
+    # matter how differently sized the overlays are
+    shards = []
+    for overlay, location in sorted(overlays.items()):
+        categories = overlay_categories(location)
+        shards += [(overlay, location, [category]) for category in categories]
 
-            # If the maximum in the secondary repo is lesser than the
-            # minimum of the packages in the primary repo, then the
-            # primary repo fully supercedes the packages in the
-            # secondary repo and the package may no longer be
-            # necessary in the secondary repo
-            if max(secondary_pkg) < min(primary_pkg):
-                yield cp
+    with ProcessPoolExecutor(max_workers=args.jobs, initializer=_init_worker,
+                             initargs=(primary_index,)) as executor:
+        records = [record for result in executor.map(_work, shards,
+                                                      chunksize=16)
+                   for record in result]
 
+    records.sort(key=lambda record: (record["overlay"], record["cp"]))
+    print_records(records, args.format)
 
-def main(primary, secondary):
-    primary_repo = pkgcore.config.load_config().repo[primary]
-    secondary_repo = pkgcore.config.load_config().repo[secondary]
-    print('\n'.join(sorted(find_obsolete_packages(primary_repo,
-                                                  secondary_repo))))
 
 if __name__ == '__main__':
-    main(sys.argv[1], sys.argv[2])
+    main()
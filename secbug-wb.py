@@ -10,100 +10,73 @@
 import argparse
 import sys
 
-import bugzilla
+from ajakscripts import gbugs, profiling, secwb
 
-import gbugs
 
-bz = bugzilla.Bugzilla('https://bugs.gentoo.org', api_key=gbugs.get_api_key())
-
-
-def maybe_glsa(severity):
-    return severity in ['blocker', 'critical', 'major', 'normal', 'minor']
-
-
-def is_arch(email):
-    arch_mails = ['amd64', 'arm', 'arm64', 'hppa', 'ppc', 'ppc64', 'sparc',
-                  'x86', 's390']
-    return email in map(lambda x: x + '@gentoo.org', arch_mails)
+def single(args):
+    bug = gbugs.getbug(args.bug, fresh=True)
 
+    # Basic sanity checks
+    problem = secwb.check(bug)
+    if problem:
+        print(problem + " Exiting.")
+        sys.exit(-1)
 
-def is_sec_email(email):
-    sec_mails = ['security', 'security-kernel', 'security-audit']
-    return email in map(lambda x: x + '@gentoo.org', sec_mails)
+    update = secwb.prune(bug, secwb.evaluate(bug))
 
+    print("Old whiteboard: " + bug.whiteboard)
+    print("New dict: " + str(update))
+    if not update:
+        print("Nothing to do")
+        return
 
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser()
-    parser.add_argument('-a', '--apply', action='store_true')
-    parser.add_argument('bug', type=int)
-    args = parser.parse_args()
+    if args.apply:
+        if 'y' in input("Update? [yN] "):
+            gbugs.update_bugs([args.bug], update)
 
-    bug = bz.getbug(args.bug)
 
-    update = {}
+def queue(args):
+    bugs = secwb.open_security_bugs()
 
-    # Go ahead and create an empty skeleton so we don't have to worry about
-    # doing it on demand. Since it's empty, it shouldn't do anything anyway.
-    update['keywords'] = {}
-    update['keywords']['add'] = []
-    update['keywords']['remove'] = []
+    updates = []
+    for bug in bugs:
+        if secwb.check(bug):
+            continue
+        update = secwb.prune(bug, secwb.evaluate(bug))
+        if update:
+            updates.append((bug, update))
 
-    update['flags'] = [{}]
-    update['comment'] = {}
+    groups = secwb.group_updates(updates)
+    print("{} open security bugs, {} to update in {} batches".format(
+        len(bugs), len(updates), len(groups)))
 
-    # Basic sanity checks
-    if not is_sec_email(bug.assigned_to):
-        print("Not a security bug! Exiting.")
-        sys.exit(-1)
-    if len(bug.whiteboard) == 0:
-        print("Bug has no whiteboard! Exiting.")
-        sys.exit(-1)
+    for update, group in groups:
+        print()
+        print("{} bug(s): {}".format(len(group), update))
+        for bug in group:
+            print("  [{}]: {} -> {}".format(
+                bug.id, bug.whiteboard,
+                update.get('whiteboard', bug.whiteboard)))
 
-    evaluation = bug.whiteboard[:2]
-    wb_next = []
-
-    if any(is_arch(email) for email in bug.cc):
-        wb_next.append('stable')
-        if 'CC-ARCHES' not in bug.keywords:
-            update['keywords']['add'].append('CC-ARCHES')
-        if 'STABLEREQ' not in bug.keywords:
-            update['keywords']['add'].append('STABLEREQ')
-    elif 'stable?' in bug.whiteboard:
-        wb_next.append('stable?')
-
-    done_stabling = 'stable' in bug.whiteboard and \
-        not any(is_arch(email) for email in bug.cc)
-
-    if done_stabling:
-        update['keywords']['remove'] = ['CC-ARCHES', 'STABLEREQ']
-        update['flags'][0]['name'] = 'sanity-check'
-        update['flags'][0]['status'] = 'X'
-        update['comment']['body'] = 'Please cleanup'
-
-    if 'glsa+' in bug.whiteboard:
-        wb_next.append('glsa+')
-    elif (bug.severity != 'trivial' and
-          ('glsa?' in bug.whiteboard or 'ebuild' not in bug.whiteboard)) or \
-         (done_stabling or 'cleanup' in bug.whiteboard):
-        # If the severity isn't trivial, If glsa? was already there
-        wb_next.append('glsa?')
-    elif 'noglsa' in bug.whiteboard:
-        wb_next.append('noglsa')
-    elif 'glsa' in bug.whiteboard:
-        wb_next.append('glsa')
-
-    if done_stabling or 'cleanup' in bug.whiteboard:
-        wb_next.append('cleanup')
-
-    if 'cve' in bug.whiteboard:
-        wb_next.append('cve')
-
-    # Make sure the format is correct
-    update['whiteboard'] = evaluation + ' [' + ' '.join(wb_next) + ']'
+    if args.apply and groups:
+        if 'y' in input("Apply {} batches? [yN] ".format(len(groups))):
+            for update, group in groups:
+                gbugs.update_bugs([bug.id for bug in group], update)
 
-    print("Old whiteboard: " + bug.whiteboard)
-    print("New dict: " + str(update))
 
-    if args.apply:
-        if 'y' in input("Update? [yN] "):
-            bz.update_bugs([args.bug], update)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-a', '--apply', action='store_true')
+    parser.add_argument('-q', '--queue', action='store_true',
+                        help="reconcile every open security bug at once")
+    parser.add_argument('bug', type=int, nargs='?')
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    profiling.setup(args)
+
+    if args.queue:
+        queue(args)
+    elif args.bug:
+        single(args)
+    else:
+        parser.error("give a bug or --queue")
@@ -1,73 +1,38 @@
 #!/usr/bin/env python
 
-from configparser import ConfigParser
+import argparse
 import os
 import sys
 
-import requests
+from ajakscripts import client, gbugs, profiling
 
-import pkgcore.config
-from pkgcore.ebuild import atom as atom_mod
 
-BZ_API = "https://bugs.gentoo.org/rest/bug"
+def file_stablereq(cpv):
+    params = client.prepare("ajakscripts.stablereq", "stablereq_params", cpv)
 
+    print(params)
+    i = input("File bug? [yN] ")
+    if 'y' not in i.lower():
+        return
 
-def cpv_to_atom(cpv):
-    repo = pkgcore.config.load_config().repo['gentoo']
-    atom = atom_mod.atom('=' + cpv)
-    return repo.match(atom)[0]
-
-
-def atom_maints(atom) -> list:
-    # Get list of strings per maintainer object
-    strings = [str(maint) for maint in atom.maintainers]
-
-    # Slice off the name, get the <email>
-    mails = [maint.split(" ")[-1] for maint in strings]
-
-    # Return list of plain emails
-    return [mail.replace("<", "").replace(">", "") for mail in mails]
-
-
-def file_stablereq(session, cpv):
-    params = {
-        "Bugzilla_api_key": apikey,
-
-        "product": "Gentoo Linux",
-        "component": "Stabilization",
-        "version": "unspecified",
-        "description": "Please stabilize, thanks!",
-        "summary": cpv + ": stabilization",
-        "cf_stabilisation_atoms": cpv + " *",
-        "keywords": ["STABLEREQ"]
-    }
-
-    atom = cpv_to_atom(cpv)
-
-    maintainers = atom_maints(atom)
-
-    params["assigned_to"] = maintainers[0]
-
-    if len(maintainers) > 1:
-        params["cc"] = maintainers[1:]
-
-    import pdb; pdb.set_trace()
-
-    req = session.post(BZ_API, params=params)
-
-    print(req.json()['id'])
+    try:
+        print(gbugs.file_bug(params))
+    except gbugs.BugzillaError as e:
+        print(e)
+        sys.exit(1)
 
 
 if __name__ == "__main__":
-    session = requests.Session()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('cpv')
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    profiling.setup(args)
+
     bugzrc = os.path.expanduser("~/.bugzrc")
 
     if not os.path.isfile(bugzrc):
         print("Can't access {}".format(bugzrc))
         sys.exit(-1)
 
-    config = ConfigParser()
-    config.read(bugzrc)
-    apikey = config['default']['key']
-
-    file_stablereq(session, sys.argv[1])
+    file_stablereq(args.cpv)